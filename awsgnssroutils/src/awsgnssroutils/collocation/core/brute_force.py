@@ -95,7 +95,7 @@ def brute_force( nadir_satellite_instrument, occs, time_tolerance, spatial_toler
             coloc = Collocation( occ, nadir_satellite_instrument, 
                           longitude = np.rad2deg( nadir_scanner_geolocations.longitudes[iscan,ifootprint] ), 
                           latitude = np.rad2deg( nadir_scanner_geolocations.latitudes[iscan,ifootprint] ), 
-                          time = nadir_scanner_geolocations.mid_times[iscan], 
+                          time = Time( gps=nadir_scanner_geolocations.mid_times_gps[iscan] ), 
                           scan_metadata = nadir_scanner_geolocations, 
                           iscan = iscan, 
                           ifootprint = ifootprint )
@@ -147,37 +147,37 @@ def brute_force_sorted( nadir_scanner_geolocations, occ,
 
     ret = { 'status': None, 'messages': [], 'comments': [], 'data': None }
 
-    #  Get nadir-scanner scans that fall within time tolerance. 
-
-    time_convention = "gps"
+    #  Get nadir-scanner scans that fall within time tolerance. All times 
+    #  are GPS seconds. 
 
     #  Occultation geolocation processing. 
 
-    occ_datetime64 = np.datetime64( get_occ_times(occ)[0].calendar(time_convention).isoformat() )
+    occ_gps = get_occ_times(occ)[0] - Time(gps=0)
     occ_longitude = np.deg2rad( occ.values("longitude")[0] )
     occ_latitude = np.deg2rad( occ.values("latitude")[0] )
 
     #  Nadir scanner geolocation processing. 
 
-    mid_times_datetime64 = np.array( [ np.datetime64( t.calendar(time_convention).isoformat() ) \
-            for t in nadir_scanner_geolocations.mid_times ] )
-
-    #  Time tolerance. 
+    mid_times_gps = nadir_scanner_geolocations.mid_times_gps
 
-    time_tolerance_timedelta64 = np.timedelta64( time_tolerance, "s" )
+    indices = np.flatnonzero( np.logical_and( 
+            mid_times_gps >= occ_gps-time_tolerance, 
+            mid_times_gps <= occ_gps+time_tolerance ) )
 
-    indices = np.argwhere( np.logical_and( 
-            mid_times_datetime64 >= occ_datetime64-time_tolerance_timedelta64, 
-            mid_times_datetime64 <= occ_datetime64+time_tolerance_timedelta64 ) ).squeeze()
+    if indices.size == 0: 
+        ret['status'] = "success"
+        return ret
 
     nadir_lons = nadir_scanner_geolocations.longitudes[indices,:]
     nadir_lats = nadir_scanner_geolocations.latitudes[indices,:]
 
-    #  Establish x,y,z coordinates of the nadir soundings. 
+    #  Establish x,y,z coordinates of the nadir soundings, dimensioned 
+    #  3 x nscans x nfootprints. 
 
-    p_nadir = np.array( [ np.cos(nadir_lons)*np.cos(nadir_lats), 
-                             np.sin(nadir_lons)*np.cos(nadir_lats), 
-                             np.sin(nadir_lats) ] ).transpose( (1,2,0) )
+    cos_nadir_lats = np.cos( nadir_lats )
+    p_nadir = np.stack( [ np.cos(nadir_lons)*cos_nadir_lats, 
+                             np.sin(nadir_lons)*cos_nadir_lats, 
+                             np.sin(nadir_lats) ], axis=0 )
 
     #  Establish x,y,z coordinates of the occultation sounding. 
 
@@ -185,13 +185,14 @@ def brute_force_sorted( nadir_scanner_geolocations, occ,
                            np.sin(occ_longitude)*np.cos(occ_latitude), 
                            np.sin(occ_latitude) ] )
 
-    #  Find angular distances to all nadir soundings (sorted in time). Find the 
-    #  index of the minimum distance. 
+    #  Find the nadir sounding (sorted in time) closest to the occultation, 
+    #  the one with the greatest inner product with the occultation; the 
+    #  angular distance is computed for that sounding only. 
 
-    dist_ang = np.arccos( np.inner( p_nadir, p_occ ) )
-    arg = dist_ang.argmin()
-    iiscan = int( arg / dist_ang.shape[1] ) 
-    iscan, ifootprint = indices[iiscan], arg % dist_ang.shape[1]
+    dot = np.einsum( "d,dij->ij", p_occ, p_nadir )
+    iiscan, ifootprint = np.unravel_index( dot.argmax(), dot.shape )
+    iscan = indices[iiscan]
+    dist_ang = np.arccos( np.clip( dot[iiscan,ifootprint], -1.0, 1.0 ) )
 
     #  Find distance of closest nadir sounding. Test against spatial tolerance. 
 
@@ -201,7 +202,7 @@ def brute_force_sorted( nadir_scanner_geolocations, occ,
 
     ret['status'] = "success"
 
-    if dist_ang[iiscan,ifootprint] <= spatial_tolerance/r_e * 1.0e-3: 
+    if dist_ang <= spatial_tolerance/r_e * 1.0e-3: 
         ret['data'] = { 'iscan': iscan, 'ifootprint': ifootprint }
     else: 
         ret['data'] = None
@@ -25,13 +25,16 @@ class CollocationList:
 #  Imports. 
 
 import os, json
+import heapq
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import xarray
 import netCDF4 
 from awsgnssroutils.database import OccList
 from .timestandards import Time
 from .nadir_satellite import NadirSatelliteInstrument, ScanMetadata
-from .constants_and_utils import masked_dataarray
+from .kernels import nearest_footprint, nearest_footprints, nearest_footprints_kernel
 
 #  Exception handling. 
 
@@ -51,6 +54,130 @@ __version__ = "1.0.0"
 
 fill_value = -1.0e20
 
+#  Occultation variables extracted by Collocation.get_data, with the names of 
+#  their dimensions (None for scalars) and their attributes in the output. 
+
+occultation_variables = { 
+        'bendingAngle': { 
+            'dims': ("impactParameter",), 
+            'attrs': { 'description': "Bending angle, ionosphere calibrated, unoptimized", 'units': "radians" } }, 
+        'impactParameter': { 
+            'dims': ("impactParameter",), 
+            'attrs': { 'description': "Impact parameter of ray", 'units': "meters" } }, 
+        'radiusOfCurvature': { 
+            'dims': None, 
+            'attrs': { 'description': "Local radius of curvature of the Earth", 'units': "meters" } }, 
+        'refractivity': { 
+            'dims': ("altitude",), 
+            'attrs': { 'description': "Refractivity", 'units': "N-units" } }, 
+        'geopotential': { 
+            'dims': ("altitude",), 
+            'attrs': { 'description': "Geopotential energy per unit mass", 'units': "J/kg" } }, 
+        'altitude': { 
+            'dims': ("altitude",), 
+            'attrs': { 'description': "Altitude above mean sea-level geoid", 'units': "meters" } } 
+        }
+
+#  Types accepted as floating point and integer arguments. 
+
+float_types = ( float, np.floating )
+integer_types = ( int, np.integer )
+
+#  Validators of the optional arguments of the Collocation constructor, in the 
+#  order of the arguments: name, accepted types, and description of the types 
+#  for error messages. 
+
+collocation_argument_validators = ( 
+        ( "longitude", float_types, "a float-type object" ), 
+        ( "latitude", float_types, "a float-type object" ), 
+        ( "time", Time, "an instance of timestandards.Time" ), 
+        ( "scan_metadata", ScanMetadata, "an instance of ScanMetadata" ), 
+        ( "scan_angle", float_types, "a float-type object" ), 
+        ( "iscan", integer_types, "an integer-type object" ), 
+        ( "ifootprint", integer_types, "an integer-type object" ) )
+
+#  Compression of numeric array variables written to NetCDF: the zlib 
+#  compression level and the maximum chunk length along each dimension. 
+
+compression_level = 4
+max_chunk_size = 1024
+
+#  Size [bytes] of the HDF5 chunk cache set for each variable read from an 
+#  occultation data file, large enough to hold all chunks of a profile. 
+
+occultation_chunk_cache_size = 16 * 1024 * 1024
+
+#  Half-width, in scans, of the window about the approximate time of a 
+#  collocation searched first when refining nadir-scanner indices. 
+
+refine_window_scans = 4
+
+#  Number of concurrent threads for downloading occultation data files. 
+
+download_threads = 16
+
+#  Buffer of nadir-scanner geolocations. Scan metadata retrieved to refine 
+#  collocations is kept keyed by nadir-satellite instrument and time bucket, 
+#  the bucket being the collocation time quantized to multiples of 
+#  geolocations_bucket_scans scans. Up to max_buffered_geolocations entries 
+#  are kept, with the least recently used discarded first. 
+
+geolocations_bucket_scans = 4
+max_buffered_geolocations = 128
+buffered_geolocations = OrderedDict()
+
+
+def get_buffered_geolocations( nadir_satellite, time ): 
+    """Return an instance of ScanMetadata containing the geolocations of the 
+    nadir_satellite instrument soundings within geolocations_bucket_scans scans 
+    of time (timestandards.Time) at least. The geolocations are retrieved by 
+    nadir_satellite.get_geolocations for a time bucket, and they are shared by 
+    all collocations in the same bucket. Results that do not span the full 
+    time range of the bucket, as when the inventory has yet to be populated 
+    there, are not buffered, so that they are retrieved again after new data 
+    are populated."""
+
+    bucket_length = geolocations_bucket_scans * nadir_satellite.time_between_scans
+    gps0 = Time( gps=0 )
+    ibucket = int( np.floor( ( time - gps0 ) / bucket_length ) )
+    key = ( nadir_satellite, ibucket )
+
+    scan_metadata = buffered_geolocations.get( key )
+
+    if scan_metadata is not None: 
+        buffered_geolocations.move_to_end( key )
+        return scan_metadata
+
+    #  The bucket is padded by one bucket length on either side so that it 
+    #  covers geolocations_bucket_scans scans about any time in the bucket. 
+
+    timerange = ( gps0 + ( ibucket - 1 ) * bucket_length, gps0 + ( ibucket + 2 ) * bucket_length )
+    scan_metadata = nadir_satellite.get_geolocations( timerange )
+
+    #  Buffer only if the scans cover the padded bucket to within one scan 
+    #  at either end. 
+
+    mid_times_gps = scan_metadata.mid_times_gps
+    covered = mid_times_gps.size > 0 \
+            and np.nanmin( mid_times_gps ) <= ( ibucket - 1 ) * bucket_length + nadir_satellite.time_between_scans \
+            and np.nanmax( mid_times_gps ) >= ( ibucket + 2 ) * bucket_length - nadir_satellite.time_between_scans
+
+    if covered: 
+        buffered_geolocations[key] = scan_metadata
+        if len( buffered_geolocations ) > max_buffered_geolocations: 
+            buffered_geolocations.popitem( last=False )
+
+    return scan_metadata
+
+
+def clear_buffered_geolocations(): 
+    """Empty the buffer of nadir-scanner geolocations. It is called whenever 
+    nadir-scanner data are populated."""
+
+    buffered_geolocations.clear()
+
+    return
+
 
 #  Collocation class definition. 
 
@@ -60,6 +187,11 @@ class Collocation():
     occultation -> An OccList of size; it contains all metadata associated with 
             the collocated occultation. 
 
+    occid -> The occultation ID of the collocated occultation. 
+
+    occultation_metadata -> A dictionary of the 'mission', 'transmitter', and 'receiver' 
+            of the collocated occultation. 
+
     nadir_satellite -> An instance of NadirSatelliteInstrument that contains 
             information on satellite and instrument name along with information on 
             the satellite's TLE's. 
@@ -91,13 +223,15 @@ class Collocation():
     by estimation and refinement given approximate values of time and scan_angle. 
     """
 
+    __slots__ = ( 'status', 'occultation', 'occid', 'occultation_metadata', 'nadir_satellite', 
+            'longitude', 'latitude', 'time', 'scan_metadata', 'scan_angle', 'iscan', 'ifootprint', 
+            'data' )
+
     def __init__( self, occultation, nadir_satellite, longitude=None, latitude=None, time=None, 
                  scan_metadata=None, scan_angle=None, iscan=None, ifootprint=None ): 
 
         #  Check input. 
 
-        integer_classes = [ int, np.byte, np.int8, np.int16, np.int32, np.int64 ] 
-
         if not isinstance( occultation, OccList ): 
             raise collocationError( "InvalidArgument", "First argument must be an instance of OccList" )
         elif occultation.size != 1: 
@@ -106,44 +240,15 @@ class Collocation():
         if not isinstance( nadir_satellite, NadirSatelliteInstrument ): 
             raise collocationError( "InvalidArgument", "Second argument must be an instance of NadirScanner" )
 
-        x = longitude
-        if x is not None: 
-            if not isinstance(x,float) and not isinstance(x,np.float32) and not isinstance(x.np.float64): 
-                raise collocationError( "InvalidArgument", "longitude must be a float-type object" )
-
-        x = latitude
-        if x is not None: 
-            if not isinstance(x,float) and not isinstance(x,np.float32) and not isinstance(x.np.float64): 
-                raise collocationError( "InvalidArgument", "latitude must be a float-type object" )
-
-        x = time
-        if x is not None: 
-            if not isinstance(x,Time): 
-                raise collocationError( "InvalidArgument", "time must be an instance of timestandards.Time" )
-
-        x = scan_metadata
-        if x is not None: 
-            if not isinstance(x,ScanMetadata): 
-                raise collocationError( "InvalidArgument", "scan_metadata must be an instance of ScanMetadata" )
-
-        x = scan_angle
-        if x is not None: 
-            if not isinstance(x,float) and not isinstance(x,np.float32) and not isinstance(x.np.float64): 
-                raise collocationError( "InvalidArgument", "scan_angle must be a float-type object" )
-
-        x = iscan
-        if x is not None: 
-            if not any( [ isinstance( x, dtype ) for dtype in integer_classes ] ): 
-                raise collocationError( "InvalidArgument", "iscan must be an integer-type object" )
-            if iscan < 0: 
-                raise collocationError( "InvalidArgument", "iscan must be greater than or equal to 0" )
-
-        x = ifootprint
-        if x is not None: 
-            if not any( [ isinstance( x, dtype ) for dtype in integer_classes ] ): 
-                raise collocationError( "InvalidArgument", "ifootprint must be an integer-type object" )
-            if ifootprint < 0: 
-                raise collocationError( "InvalidArgument", "ifootprint must be greater than or equal to 0" )
+        arguments = ( longitude, latitude, time, scan_metadata, scan_angle, iscan, ifootprint )
+
+        for x, ( name, types, description ) in zip( arguments, collocation_argument_validators ): 
+            if x is not None and not isinstance( x, types ): 
+                raise collocationError( "InvalidArgument", f"{name} must be {description}" )
+
+        for name, x in ( ( "iscan", iscan ), ( "ifootprint", ifootprint ) ): 
+            if x is not None and x < 0: 
+                raise collocationError( "InvalidArgument", f"{name} must be greater than or equal to 0" )
 
         if scan_metadata is not None: 
             nscans, nfootprints = scan_metadata.longitudes.shape
@@ -158,6 +263,8 @@ class Collocation():
 
         self.status = "nominal"
         self.occultation = occultation
+        self.occid = occultation._data[0]['occid']
+        self.occultation_metadata = { k: occultation._data[0][k] for k in ( 'mission', 'transmitter', 'receiver' ) }
         self.nadir_satellite = nadir_satellite
         self.longitude = longitude
         self.latitude = latitude
@@ -168,10 +275,80 @@ class Collocation():
         self.ifootprint = ifootprint
         self.data = None
 
+    def download_occultation( self, ro_processing_center ): 
+        """Download the refractivity retrieval file of the RO processing center 
+        ro_processing_center for the collocated occultation and return its 
+        local path."""
+
+        occ_files = self.occultation.download( f"{ro_processing_center}_refractivityRetrieval", silent=True )
+        if len( occ_files ) != 1: 
+            raise collocationError( "InvalidOccultation", 
+                    f"Unable to obtain {ro_processing_center}_refractivityRetrieval for collocated occultation" )
+
+        return occ_files[0]
+
     def refine_scanner_indices( self ): 
         """Find the actual nadir-scanner sounding that is closest in space to the 
         occultation."""
 
+        #  Check for necessary information; get scan data if needed. 
+
+        if not self.prepare_refinement(): 
+            return self
+
+        #  Establish position of occultation. 
+
+        lon, lat = np.deg2rad( self.occultation.values("longitude")[0] ), np.deg2rad( self.occultation.values("latitude")[0] )
+
+        #  Search the local swath first; otherwise find actual ifootprint, iscan 
+        #  of closest nadir-scanner sounding using the spatial index of the 
+        #  nadir-scanner soundings. 
+
+        indices = self.nearest_in_window( lon, lat )
+
+        if indices is None: 
+            indices = self.scan_metadata.footprint_index.nearest( lon, lat )
+
+        self.set_scanner_indices( *indices )
+
+        #  Done. 
+
+        return self
+
+    def nearest_in_window( self, lon, lat ): 
+        """Local swath shortcut: search only the scans within refine_window_scans 
+        of the approximate time of the collocated nadir-scanner sounding for the 
+        sounding closest to the point lon, lat [radians]. The distance to the 
+        occultation varies smoothly along track, so if the closest sounding in 
+        the window is not in an edge scan of the window (unless that is also an 
+        edge of the scan metadata), it is taken to be the closest of all and the 
+        tuple (iscan, ifootprint) is returned. Otherwise None is returned, and 
+        the caller searches all of the scans."""
+
+        lons, lats = self.scan_metadata.longitudes, self.scan_metadata.latitudes
+        nscans = lons.shape[0]
+
+        dt = np.abs( self.scan_metadata.mid_times_gps - ( self.time - Time(gps=0) ) )
+        iscan0 = int( np.nanargmin( dt ) ) if np.isfinite( dt ).any() else 0
+        i1, i2 = max( 0, iscan0-refine_window_scans ), min( nscans, iscan0+refine_window_scans+1 )
+
+        #  The cosines of the latitudes of the window, if they are needed, are 
+        #  computed by nearest_footprint for the window only. 
+
+        iiscan, ifootprint = nearest_footprint( lons[i1:i2,:], lats[i1:i2,:], lon, lat )
+        iscan = i1 + iiscan
+
+        if ( iscan > i1 or i1 == 0 ) and ( iscan < i2-1 or i2 == nscans ): 
+            return iscan, ifootprint
+
+        return None
+
+    def prepare_refinement( self ): 
+        """Check that the information necessary to refine the nadir-scanner 
+        indices is available, retrieving the scan metadata if needed. Return 
+        True if there are nadir-scanner soundings to search. If there are none, 
+        the status is set accordingly and False is returned."""
+
         #  Check for necessary information. 
 
         if self.scan_angle is None: 
@@ -185,47 +362,38 @@ class Collocation():
         #  Get scan data if needed. 
 
         if self.scan_metadata is None: 
-
-            timerange = ( self.time - 4*self.nadir_satellite.time_between_scans, 
-                         self.time + 4*self.nadir_satellite.time_between_scans )
-
-            self.scan_metadata = self.nadir_satellite.get_geolocations( timerange )
+            self.scan_metadata = get_buffered_geolocations( self.nadir_satellite, self.time )
 
         if len( self.scan_metadata.longitudes ) == 0: 
             self.status = "no sounder data available"
-            return self
-
-        nscans, nfootprints = self.scan_metadata.longitudes.shape
+            return False
 
-        #  Establish position of occultation, position of nadir-scanner soundings. 
+        return True
 
-        lon, lat = np.deg2rad( self.occultation.values("longitude")[0] ), np.deg2rad( self.occultation.values("latitude")[0] )
-        p_occ = np.array( [ np.cos(lon)*np.cos(lat), np.sin(lon)*np.cos(lat), np.sin(lat) ] )
+    def set_scanner_indices( self, iscan, ifootprint ): 
+        """Set the scan and footprint indices of the collocated nadir-scanner 
+        sounding along with its longitude and latitude."""
 
         lons, lats = self.scan_metadata.longitudes, self.scan_metadata.latitudes
-        p_sounder = np.array( [ np.cos(lons)*np.cos(lats), np.sin(lons)*np.cos(lats), np.sin(lats) ] ).transpose( (1,2,0) )
 
-        #  Find minimum distance. Find actual ifootprint, iscan of closest nadir-scanner sounding. 
-
-        distances = np.arccos( np.inner( p_sounder, p_occ ) )
-        i = distances.argmin()
-        self.iscan = int( i / nfootprints )
-        self.ifootprint = i % nfootprints
+        self.iscan = int( iscan )
+        self.ifootprint = int( ifootprint )
 
         self.longitude = np.rad2deg( lons[ self.iscan, self.ifootprint ] )
         self.latitude = np.rad2deg( lats[ self.iscan, self.ifootprint ] )
 
-        #  Done. 
-
-        return self
+        return
 
-    def get_data( self, ro_processing_center ): 
+    def get_data( self, ro_processing_center, occ_file=None ): 
         """Get occultation and nadir-scanner data. 
 
         Arguments
         ---------
         ro_processing_center: str
             The name of the RO processing center to use as the source of occultation data
+        occ_file: str
+            The path to the already downloaded occultation data file. If None, 
+            it is downloaded. 
 
         Returns
         ---------
@@ -236,19 +404,17 @@ class Collocation():
 
         #  Download occultation data file. 
 
-        occ_files = self.occultation.download( f"{ro_processing_center}_refractivityRetrieval", silent=True )
-        if len( occ_files ) != 1: 
-            raise collocationError( "InvalidOccultation", 
-                    f"Unable to obtain {ro_processing_center}_refractivityRetrieval for collocated occultation" )
-        occ_file = occ_files[0]
+        if occ_file is None: 
+            occ_file = self.download_occultation( ro_processing_center )
 
         #  Initialize output dictionary. 
 
         ret = {}
 
-        #  Extract occultation data. 
-
-        d = netCDF4.Dataset( occ_file, 'r' )
+        #  Extract occultation data. Only the variables in occultation_variables 
+        #  are read, each with a chunk cache of occultation_chunk_cache_size bytes 
+        #  set for that variable alone. Masked and NaN values are replaced by 
+        #  fill_value. 
 
         longitude_dataarray = xarray.DataArray( self.occultation.values("longitude")[0] )
         longitude_dataarray.attrs.update( { 
@@ -260,60 +426,36 @@ class Collocation():
             'description': "Latitude of radio occultation sounding, northward", 
             'units': "degrees" } )
 
-        bendingangle_dataarray = masked_dataarray( d.variables['bendingAngle'][:], fill_value, 
-            dims=("impactParameter",) )
-        bendingangle_dataarray.attrs.update( { 
-            'description': "Bending angle, ionosphere calibrated, unoptimized", 
-            'units': "radians" } )
-
-        impactparameter_dataarray = masked_dataarray( d.variables['impactParameter'][:], fill_value, 
-            dims=("impactParameter",) )
-        impactparameter_dataarray.attrs.update( { 
-            'description': "Impact parameter of ray", 
-            'units': "meters" } )
-
-        radiusofcurvature_dataarray = xarray.DataArray( d.variables['radiusOfCurvature'].getValue() )
-        radiusofcurvature_dataarray.attrs.update( { 
-            'description': "Local radius of curvature of the Earth", 
-            'units': "meters" } )
-
-        refractivity_dataarray = masked_dataarray( d.variables['refractivity'][:], fill_value, 
-            dims=("altitude",) )
-        refractivity_dataarray.attrs.update( { 
-            'description': "Refractivity", 
-            'units': "N-units" } )
-
-        geopotential_dataarray = masked_dataarray( d.variables['geopotential'][:], fill_value, 
-            dims=("altitude",) )
-        geopotential_dataarray.attrs.update( { 
-            'description': "Geopotential energy per unit mass", 
-            'units': "J/kg" } )
-
-        altitude_dataarray = masked_dataarray( d.variables['altitude'][:], fill_value, 
-            dims=("altitude",) )
-        altitude_dataarray.attrs.update( { 
-            'description': "Altitude above mean sea-level geoid", 
-            'units': "meters" } )
-
-        ds_occultation = xarray.Dataset( { 
-            'longitude': longitude_dataarray, 
-            'latitude': latitude_dataarray, 
-            'bendingAngle': bendingangle_dataarray, 
-            'impactParameter': impactparameter_dataarray, 
-            'radiusOfCurvature': radiusofcurvature_dataarray, 
-            'refractivity': refractivity_dataarray, 
-            'geopotential': geopotential_dataarray, 
-            'altitude': altitude_dataarray } )
+        ds_dict = { 'longitude': longitude_dataarray, 'latitude': latitude_dataarray }
+
+        with netCDF4.Dataset( occ_file, 'r' ) as d: 
+
+            for vname, spec in occultation_variables.items(): 
+
+                var = d.variables[vname]
+                var.set_var_chunk_cache( size=max( var.get_var_chunk_cache()[0], occultation_chunk_cache_size ) )
+                values = np.ma.masked_invalid( var[:] )
+                attrs = dict( spec['attrs'] )
+
+                if spec['dims'] is None: 
+                    ds_dict.update( { vname: xarray.DataArray( np.ma.filled( values, np.nan ), attrs=attrs ) } )
+                    continue
+
+                xfill = values.dtype.type( fill_value )
+                values = np.ma.filled( values, xfill )
+                attrs.update( { '_FillValue': xfill } )
+
+                ds_dict.update( { vname: xarray.DataArray( values, dims=spec['dims'], attrs=attrs ) } )
+
+        ds_occultation = xarray.Dataset( ds_dict )
 
         ds_occultation.attrs.update( {
-            'file': occ_files[0], 
-            'mission': self.occultation._data[0]['mission'], 
-            'transmitter': self.occultation._data[0]['transmitter'], 
-            'receiver': self.occultation._data[0]['receiver'], 
+            'file': occ_file, 
+            'mission': self.occultation_metadata['mission'], 
+            'transmitter': self.occultation_metadata['transmitter'], 
+            'receiver': self.occultation_metadata['receiver'], 
             'time': self.time.calendar("utc").isoformat(timespec="seconds")+"Z" } )
 
-        d.close()
-
         #  Find the actual closest nadir-scanner sounding. 
 
         if self.iscan is None or self.ifootprint is None: 
@@ -323,7 +465,7 @@ class Collocation():
 
             #  Extract sounder data. 
 
-            self.time = self.scan_metadata.mid_times[self.iscan] 
+            self.time = Time( gps=self.scan_metadata.mid_times_gps[self.iscan] ) 
             ds_sounder = self.scan_metadata( self.iscan, self.ifootprint, 
                     longitude=self.longitude, latitude=self.latitude, time=self.time )
 
@@ -334,7 +476,7 @@ class Collocation():
         #  Merge occultation and sounder data. 
 
         ds = { 'occultation': ds_occultation, 'sounder': ds_sounder, 
-                'occid': self.occultation._data[0]['occid'] } 
+                'occid': self.occid } 
 
         #  Done. 
 
@@ -356,16 +498,21 @@ def collocation_confusion( occs, collocations_bruteforce, collocations_rotation
     if not isinstance( collocations_bruteforce, list ) or not isinstance( collocations_rotation, list ): 
         raise collocationError( "InvalidArgument", "Both arguments must be lists" )
 
-    if not isinstance( collocations_bruteforce[0], Collocation ): 
-        raise collocationError( "InvalidArgument", "First argument must be a list of instances of Collocation" )
+    if len( collocations_bruteforce ) > 0 and not isinstance( collocations_bruteforce[0], Collocation ): 
+        raise collocationError( "InvalidArgument", "Second argument must be a list of instances of Collocation" )
+
+    if len( collocations_rotation ) > 0 and not isinstance( collocations_rotation[0], Collocation ): 
+        raise collocationError( "InvalidArgument", "Third argument must be a list of instances of Collocation" )
 
-    if not isinstance( collocations_rotation[0], Collocation ): 
-        raise collocationError( "InvalidArgument", "First argument must be a list of instances of Collocation" )
+    #  Count occultations by their IDs. Either list can be empty. 
+
+    occids_bruteforce = { c.occid for c in collocations_bruteforce }
+    occids_rotation = { c.occid for c in collocations_rotation }
 
     n_total = occs.size
-    n_in_bruteforce = len( collocations_bruteforce )
-    n_in_rotation = len( collocations_rotation )
-    n_in_both = len( collocations_bruteforce.intersection( collocations_rotation ) ) 
+    n_in_bruteforce = len( occids_bruteforce )
+    n_in_rotation = len( occids_rotation )
+    n_in_both = len( occids_bruteforce & occids_rotation )
 
     ret = { 'true_positive': n_in_both, 
            'false_negative': n_in_bruteforce - n_in_both, 
@@ -379,6 +526,8 @@ class CollocationList( list ):
     """A list of collocations. While inheriting the list class, it adds methods to 
     perform unions, intersections, and writing to output."""
 
+    __slots__ = ( '_occid_index', '_occid_index_key' )
+
     def __init__( self, input_list:list ): 
         """The input should be a list of instances of class Collocation."""
 
@@ -392,8 +541,120 @@ class CollocationList( list ):
 
         super().__init__( input_list )
 
+        self._occid_index = None
+        self._occid_index_key = None
+
         return
 
+    @property
+    def occid_index( self ): 
+        """A dictionary of the collocations in the list keyed by occultation ID. 
+        It is built once and rebuilt only if the contents of the list change."""
+
+        key = tuple( map( id, self ) )
+
+        if self._occid_index is None or self._occid_index_key != key: 
+            self._occid_index = { c.occid: c for c in self }
+            self._occid_index_key = key
+
+        return self._occid_index
+
+
+    def refine_all( self ): 
+        """Refine the nadir-scanner indices of all collocations in the list whose 
+        indices are not yet set. This is equivalent to calling 
+        refine_scanner_indices on each such collocation: the 
+        local swath of each collocation is searched first by nearest_in_window, 
+        but the collocations whose local swath search is inconclusive and that 
+        share the same scan metadata are then searched together in a single call 
+        to the nearest_footprints kernel."""
+
+        #  Search the local swath of each collocation, and group the remaining 
+        #  collocations by scan metadata. 
+
+        groups = {}
+
+        for collocation in self: 
+
+            if collocation.iscan is not None and collocation.ifootprint is not None: 
+                continue
+
+            if not collocation.prepare_refinement(): 
+                continue
+
+            lon = np.deg2rad( collocation.occultation.values("longitude")[0] )
+            lat = np.deg2rad( collocation.occultation.values("latitude")[0] )
+            indices = collocation.nearest_in_window( lon, lat )
+
+            if indices is None: 
+                groups.setdefault( id( collocation.scan_metadata ), [] ).append( ( collocation, lon, lat ) )
+            else: 
+                collocation.set_scanner_indices( *indices )
+
+        #  Search all scans for each group of collocations. The cached cosines 
+        #  of the latitudes are needed only by the numpy version of the search. 
+
+        for members in groups.values(): 
+
+            collocations = [ member[0] for member in members ]
+            lon0s = np.array( [ member[1] for member in members ] )
+            lat0s = np.array( [ member[2] for member in members ] )
+            scan_metadata = collocations[0].scan_metadata
+
+            cos_lats = scan_metadata.cos_latitudes if nearest_footprints_kernel is None else None
+            iscans, ifootprints = nearest_footprints( scan_metadata.longitudes, scan_metadata.latitudes, 
+                    lon0s, lat0s, cos_lats=cos_lats )
+
+            for collocation, iscan, ifootprint in zip( collocations, iscans, ifootprints ): 
+                collocation.set_scanner_indices( iscan, ifootprint )
+
+        #  Done. 
+
+        return self
+
+    def prefetch_occ_files( self, ro_processing_center ): 
+        """Download the refractivity retrieval files of the RO processing center 
+        ro_processing_center for all collocations in the list, concurrently over 
+        download_threads threads. A dictionary of local paths keyed by occultation 
+        ID is returned."""
+
+        collocations = list( self.occid_index.items() )
+
+        with ThreadPoolExecutor( max_workers=download_threads ) as executor: 
+            paths = list( executor.map( 
+                    lambda item: item[1].download_occultation( ro_processing_center ), collocations ) )
+
+        ret = { occid: path for ( occid, c ), path in zip( collocations, paths ) }
+
+        return ret
+
+    def get_data( self, ro_processing_center ): 
+        """Get occultation and nadir-scanner data for all collocations in the list. 
+        The occultation data files are downloaded concurrently first and the 
+        nadir-scanner indices are refined together by refine_all, after which 
+        the data files are read one collocation at a time. A list of the data 
+        dictionaries returned by Collocation.get_data is returned."""
+
+        occ_files = self.prefetch_occ_files( ro_processing_center )
+        self.refine_all()
+
+        ret = [ collocation.get_data( ro_processing_center, 
+                occ_file=occ_files[collocation.occid] ) for collocation in self ]
+
+        return ret
+
+    def sorted_occids( self ): 
+        """Return the list of the occultation IDs of the collocations if the 
+        collocations are sorted by occultation ID, as after sort_by("occid"); 
+        otherwise return None."""
+
+        occids = [ c.occid for c in self ]
+
+        for i in range( 1, len( occids ) ): 
+            if occids[i] < occids[i-1]: 
+                return None
+
+        return occids
 
     def union( self, union_list ): 
         """Return the union with the argument (instance of CollocationList)."""
@@ -403,18 +664,27 @@ class CollocationList( list ):
         if not isinstance( union_list, CollocationList ): 
             raise collocationError( "InvalidArgument", "Argument to CollocationList.union must be a CollocationList" )
 
-        #  Create a dictionary corresponding to both lists. 
+        #  Dictionaries corresponding to both lists. 
 
-        dict1 = { c.occultation._data[0]['occid']: c for c in self }
-        dict2 = { c.occultation._data[0]['occid']: c for c in union_list }
+        dict1, dict2 = self.occid_index, union_list.occid_index
 
-        #  Get union of "occid" keys. 
+        #  Get union of "occid" keys. If both lists are already sorted by 
+        #  occultation ID, merge them in linear time. 
 
-        keys = sorted( list( set( dict1.keys() ).union( set( dict2.keys() ) ) ) )
+        keys1, keys2 = self.sorted_occids(), union_list.sorted_occids()
 
-        #  Generate the result. 
+        if keys1 is not None and keys2 is not None: 
+            keys = []
+            for k in heapq.merge( keys1, keys2 ): 
+                if len( keys ) == 0 or keys[-1] != k: 
+                    keys.append( k )
+        else: 
+            keys = sorted( dict1.keys() | dict2.keys() )
 
-        ret = CollocationList( [ dict1[k] for k in keys ] )
+        #  Generate the result, taking collocations from this list where an 
+        #  occultation is in both. 
+
+        ret = CollocationList( [ dict1[k] if k in dict1 else dict2[k] for k in keys ] )
 
         #  Done. 
 
@@ -428,14 +698,30 @@ class CollocationList( list ):
         if not isinstance( union_list, CollocationList ): 
             raise collocationError( "InvalidArgument", "Argument to CollocationList.intersection must be a CollocationList" )
 
-        #  Create a dictionary corresponding to both lists. 
+        #  Dictionaries corresponding to both lists. 
+
+        dict1, dict2 = self.occid_index, union_list.occid_index
 
-        dict1 = { c.occultation._data[0]['occid']: c for c in self }
-        dict2 = { c.occultation._data[0]['occid']: c for c in union_list }
+        #  Get intersection of "occid" keys. If both lists are already sorted 
+        #  by occultation ID, walk them together in linear time. 
 
-        #  Get intersection of "occid" keys. 
+        keys1, keys2 = self.sorted_occids(), union_list.sorted_occids()
 
-        keys = sorted( list( set( dict1.keys() ).intersection( set( dict2.keys() ) ) ) )
+        if keys1 is not None and keys2 is not None: 
+            keys = []
+            i1, i2 = 0, 0
+            while i1 < len( keys1 ) and i2 < len( keys2 ): 
+                if keys1[i1] < keys2[i2]: 
+                    i1 += 1
+                elif keys2[i2] < keys1[i1]: 
+                    i2 += 1
+                else: 
+                    if len( keys ) == 0 or keys[-1] != keys1[i1]: 
+                        keys.append( keys1[i1] )
+                    i1 += 1
+                    i2 += 1
+        else: 
+            keys = sorted( dict1.keys() & dict2.keys() )
 
         #  Generate the result. 
 
@@ -477,7 +763,7 @@ class CollocationList( list ):
 
             #  Write occultation and sounder data. 
 
-            occid = collocation.occultation._data[0]['occid']
+            occid = collocation.occid
             collocation_name = occid + "+" + \
                     collocation.nadir_satellite.satellite_name + "-" + \
                     collocation.nadir_satellite.instrument_name
@@ -512,6 +798,25 @@ class CollocationList( list ):
 
         return
 
+    def sort_by( self, method="occtime" ): 
+        """Sort the collocations in place. If method is "occid", 
+        sort by occultation ID; if it is "occtime", sort by the time of the 
+        occultation, breaking ties by occultation ID. Sorting by occultation time 
+        requires that the data of all collocations have been retrieved by get_data."""
+
+        if method == "occid": 
+            key = lambda c: c.occid
+
+        elif method == "occtime": 
+            key = lambda c: ( c.data['occultation'].attrs['time'], c.occid )
+
+        else: 
+            raise collocationError( "InvalidArgument", f'Unrecognized method {method} to sort a CollocationList' )
+
+        self.sort( key=key )
+
+        return
+
     ############################################################
     #  Magic methods. 
     ############################################################
@@ -525,29 +830,6 @@ class CollocationList( list ):
 
         return ret
 
-    def __sort__( self, method="occtime" ): 
-
-        if method == "occid": 
-            sdict = { c.data['occid']: c for c in self } 
-
-        elif method == "occtime": 
-            sdict = {}
-            for element in self: 
-                time = c.data['occultation'].attrs['time']
-                for ikeychar in range(26): 
-                    key = time + chr( ord("a") + ikeychar )
-                    if key not in sdict.keys(): 
-                        break
-                sdict.update( { key: element } )
-
-        else: 
-            raise collocationError( "InvalidArgument", f'Unrecognized method {method} to sort a CollocationList' )
-
-        keys = sorted( list( sdict.keys() ) )
-        ret = CollocationList( [ sdict[key] for key in keys ] )
-
-        return ret
-
 
 def write_dataset_to_netcdf( dataset, nc ): 
     """Write an xarray Dataset (dataset) to an open NetCDF file or group (nc)."""
@@ -565,22 +847,29 @@ def write_dataset_to_netcdf( dataset, nc ):
     for name, size in dataset.sizes.items(): 
         nc.createDimension( name, size )
 
-    #  Create variables and their attributes. 
+    #  Create variables and their attributes, writing the data values of each. 
+    #  Numeric array variables are chunked and compressed. The fill value must 
+    #  be defined when a variable is created rather than as an attribute. 
 
-    variables = {}
     for vname, vobj in dataset.variables.items(): 
-        v = nc.createVariable( vname, vobj.dtype, vobj.dims )
-        v.setncatts( vobj.attrs )
-        variables.update( { vname: v } )
 
-    #  Create global attributes. 
+        attrs = dict( vobj.attrs )
+        kwargs = {}
 
-    nc.setncatts( dataset.attrs )
+        if '_FillValue' in attrs: 
+            kwargs.update( { 'fill_value': attrs.pop( '_FillValue' ) } )
+
+        if vobj.ndim > 0 and vobj.dtype.kind in "fiu": 
+            kwargs.update( { 'zlib': True, 'complevel': compression_level, 
+                    'chunksizes': tuple( [ max( 1, min( max_chunk_size, n ) ) for n in vobj.shape ] ) } )
 
-    #  Write data values. 
+        v = nc.createVariable( vname, vobj.dtype, vobj.dims, **kwargs )
+        v.setncatts( attrs )
+        v[:] = vobj.values
 
-    for vname, vobj in variables.items(): 
-        vobj[:] = dataset.variables[vname].values
+    #  Create global attributes. 
+
+    nc.setncatts( dataset.attrs )
 
     #  Done. 
 
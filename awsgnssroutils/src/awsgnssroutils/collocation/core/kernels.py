@@ -0,0 +1,293 @@
+"""kernels.py
+
+This module contains numerical kernels for the search of nadir-scanner
+footprints nearest to radio occultation soundings. If numba is installed,
+the kernels are compiled as fused loops over the footprint grid with no
+temporary arrays; otherwise, equivalent vectorized numpy versions are used.
+
+nearest_footprint:
+    Find the (iscan, ifootprint) of the nadir-scanner footprint nearest
+    to a single point.
+
+nearest_footprints:
+    Find the (iscan, ifootprint) of the nadir-scanner footprints nearest
+    to each of many points, in parallel over the points if numba is
+    installed.
+
+class FootprintIndex:
+    A spatial index of nadir-scanner footprints for exact nearest-footprint
+    queries that examine only the footprints in the vicinity of a point."""
+
+
+#  Imports.
+
+import numpy as np
+
+try:
+    import numba
+    prange = numba.prange
+except ImportError:
+    numba = None
+    prange = range
+
+
+#  Numba signatures of nearest_footprint_loop, for single and double
+#  precision footprint geolocations.
+
+nearest_footprint_signatures = [
+        "Tuple((i8,i8))(f4[:,::1],f4[:,::1],f8,f8)",
+        "Tuple((i8,i8))(f8[:,::1],f8[:,::1],f8,f8)" ]
+
+#  Numba signatures of nearest_footprints_loop.
+
+nearest_footprints_signatures = [
+        "void(f4[:,::1],f4[:,::1],f8[::1],f8[::1],i8[::1],i8[::1])",
+        "void(f8[:,::1],f8[:,::1],f8[::1],f8[::1],i8[::1],i8[::1])" ]
+
+
+def nearest_footprint_loop( lons, lats, lon0, lat0 ):
+    """Scalar-loop version of nearest_footprint, to be compiled by numba.
+    The haversine of the great-circle angle between each footprint and the
+    point is computed and its minimum tracked in scalar locals. The
+    haversine is never greater than 1, which initializes the minimum."""
+
+    nscans, nfootprints = lons.shape
+    coslat0 = np.cos( lat0 )
+
+    best_a = 2.0
+    best_iscan, best_ifootprint = 0, 0
+
+    for iscan in range( nscans ):
+        for ifootprint in range( nfootprints ):
+            s_lat = np.sin( 0.5 * ( lats[iscan,ifootprint] - lat0 ) )
+            s_lon = np.sin( 0.5 * ( lons[iscan,ifootprint] - lon0 ) )
+            a = s_lat * s_lat + coslat0 * np.cos( lats[iscan,ifootprint] ) * s_lon * s_lon
+            if a < best_a:
+                best_a = a
+                best_iscan, best_ifootprint = iscan, ifootprint
+
+    return best_iscan, best_ifootprint
+
+
+def nearest_footprints_loop( lons, lats, lon0s, lat0s, out_iscan, out_ifootprint ):
+    """Scalar-loop version of nearest_footprints, to be compiled by numba
+    with parallel=True. The outer loop over the points lon0s, lat0s is
+    distributed over threads by prange; the indices of the nearest
+    footprints are written into out_iscan and out_ifootprint."""
+
+    nscans, nfootprints = lons.shape
+
+    for k in prange( lon0s.size ):
+
+        lon0, lat0 = lon0s[k], lat0s[k]
+        coslat0 = np.cos( lat0 )
+
+        best_a = 2.0
+        best_iscan, best_ifootprint = 0, 0
+
+        for iscan in range( nscans ):
+            for ifootprint in range( nfootprints ):
+                s_lat = np.sin( 0.5 * ( lats[iscan,ifootprint] - lat0 ) )
+                s_lon = np.sin( 0.5 * ( lons[iscan,ifootprint] - lon0 ) )
+                a = s_lat * s_lat + coslat0 * np.cos( lats[iscan,ifootprint] ) * s_lon * s_lon
+                if a < best_a:
+                    best_a = a
+                    best_iscan, best_ifootprint = iscan, ifootprint
+
+        out_iscan[k] = best_iscan
+        out_ifootprint[k] = best_ifootprint
+
+    return
+
+
+def nearest_footprint_numpy( lons, lats, lon0, lat0, cos_lats=None ):
+    """Vectorized numpy version of nearest_footprint. The haversine of the
+    great-circle angle, a = sin**2(dlat/2) + cos(lat0) cos(lats) sin**2(dlon/2),
+    increases monotonically with distance, so its minimum identifies the
+    closest footprint. It is computed in place in two work arrays. The
+    cosines of lats are computed if cos_lats is not given."""
+
+    if cos_lats is None:
+        cos_lats = np.cos( lats )
+
+    a = np.empty( lons.shape )
+    b = np.empty( lons.shape )
+
+    np.subtract( lats, lat0, out=a )
+    np.multiply( a, 0.5, out=a )
+    np.sin( a, out=a )
+    np.square( a, out=a )
+
+    np.subtract( lons, lon0, out=b )
+    np.multiply( b, 0.5, out=b )
+    np.sin( b, out=b )
+    np.square( b, out=b )
+    np.multiply( b, cos_lats, out=b )
+    np.multiply( b, np.cos( lat0 ), out=b )
+
+    np.add( a, b, out=a )
+
+    iscan, ifootprint = np.unravel_index( a.argmin(), a.shape )
+
+    return int( iscan ), int( ifootprint )
+
+
+if numba is not None:
+    nearest_footprint_kernel = numba.njit( nearest_footprint_signatures,
+            cache=True, fastmath=True )( nearest_footprint_loop )
+    nearest_footprints_kernel = numba.njit( nearest_footprints_signatures,
+            parallel=True, cache=True, fastmath=True )( nearest_footprints_loop )
+else:
+    nearest_footprint_kernel = None
+    nearest_footprints_kernel = None
+
+
+def common_float_arrays( lons, lats ):
+    """Return lons and lats as C-contiguous arrays of a common floating
+    point type, float32 if both are float32 and float64 otherwise, as
+    required by the compiled kernels."""
+
+    if lons.dtype == np.float32 and lats.dtype == np.float32:
+        dtype = np.float32
+    else:
+        dtype = np.float64
+
+    return np.ascontiguousarray( lons, dtype=dtype ), np.ascontiguousarray( lats, dtype=dtype )
+
+
+def nearest_footprint( lons, lats, lon0, lat0, cos_lats=None ):
+    """Find the nadir-scanner footprint nearest to a point. lons and lats are
+    the footprint longitudes and latitudes [radians], dimensioned nscans x
+    nfootprints; lon0 and lat0 are the longitude and latitude [radians] of
+    the point. The cosines of lats can be given as cos_lats so that they are
+    not recomputed by the numpy version; the compiled kernel computes them
+    inline. The tuple (iscan, ifootprint) of integers is returned."""
+
+    lon0, lat0 = float( lon0 ), float( lat0 )
+
+    if nearest_footprint_kernel is None:
+        return nearest_footprint_numpy( lons, lats, lon0, lat0, cos_lats=cos_lats )
+
+    lons, lats = common_float_arrays( lons, lats )
+    iscan, ifootprint = nearest_footprint_kernel( lons, lats, lon0, lat0 )
+
+    return int( iscan ), int( ifootprint )
+
+
+def nearest_footprints( lons, lats, lon0s, lat0s, cos_lats=None ):
+    """Find the nadir-scanner footprints nearest to many points. lons and lats
+    are the footprint longitudes and latitudes [radians], dimensioned nscans x
+    nfootprints; lon0s and lat0s are list-like longitudes and latitudes
+    [radians] of the points. cos_lats is as for nearest_footprint. Two
+    np.ndarrays of integers, iscan and ifootprint, each with one element per
+    point, are returned."""
+
+    lon0s = np.ascontiguousarray( lon0s, dtype=np.float64 ).reshape( -1 )
+    lat0s = np.ascontiguousarray( lat0s, dtype=np.float64 ).reshape( -1 )
+
+    out_iscan = np.zeros( lon0s.size, dtype=np.int64 )
+    out_ifootprint = np.zeros( lon0s.size, dtype=np.int64 )
+
+    if nearest_footprints_kernel is None:
+        if cos_lats is None:
+            cos_lats = np.cos( lats )
+        for k in range( lon0s.size ):
+            out_iscan[k], out_ifootprint[k] = nearest_footprint_numpy( lons, lats, lon0s[k], lat0s[k], cos_lats=cos_lats )
+    else:
+        lons, lats = common_float_arrays( lons, lats )
+        nearest_footprints_kernel( lons, lats, lon0s, lat0s, out_iscan, out_ifootprint )
+
+    return out_iscan, out_ifootprint
+
+
+#  Default edge length of the cubic cells of FootprintIndex, in units of
+#  Earth radius (~32 km).
+
+footprint_index_cell_size = 0.005
+
+
+#  Integer offsets of the cells of a 3 x 3 x 3 block from its central cell.
+
+cell_neighbour_offsets = np.array( [ ( i, j, k ) for i in ( -1, 0, 1 ) for j in ( -1, 0, 1 ) for k in ( -1, 0, 1 ) ],
+        dtype=np.int64 )
+
+
+class FootprintIndex():
+    """A spatial index of nadir-scanner footprints. The footprints are
+    represented as unit vectors, which are binned into cubic cells of edge
+    length cell_size (in units of Earth radius). A query for the footprint
+    nearest to a point examines only the footprints in the 3 x 3 x 3 block of
+    cells surrounding the point. Any footprint outside of that block is
+    farther than cell_size from the point, so if the nearest footprint found
+    in the block is within cell_size of the point, it is the nearest of all
+    footprints. Otherwise the query falls back to nearest_footprint.
+
+    lons and lats are the footprint longitudes and latitudes [radians],
+    dimensioned nscans x nfootprints."""
+
+    def __init__( self, lons, lats, cell_size=footprint_index_cell_size ):
+
+        self.lons, self.lats = lons, lats
+        self.shape = lons.shape
+        self.cell_size = cell_size
+
+        #  Unit vectors of the footprints.
+
+        lons_flat = np.asarray( lons, dtype=np.float64 ).reshape( -1 )
+        lats_flat = np.asarray( lats, dtype=np.float64 ).reshape( -1 )
+        cos_lats = np.cos( lats_flat )
+
+        self.vectors = np.stack( [ np.cos( lons_flat ) * cos_lats,
+                np.sin( lons_flat ) * cos_lats, np.sin( lats_flat ) ], axis=1 )
+
+        #  Sort the footprints by cell, and record the range of sorted
+        #  footprints in each cell.
+
+        keys = self.cell_keys( self.cell_indices( self.vectors ) )
+        self.order = np.argsort( keys, kind="stable" )
+        unique_keys, starts, counts = np.unique( keys[self.order], return_index=True, return_counts=True )
+
+        self.cells = { int( k ): ( int( i ), int( i+n ) ) for k, i, n in zip( unique_keys, starts, counts ) }
+
+    def cell_indices( self, vectors ):
+        """Return the integer indices of the cells containing unit vectors, an
+        np.ndarray dimensioned n x 3, as an np.ndarray dimensioned n x 3."""
+
+        return np.floor( vectors / self.cell_size ).astype( np.int64 )
+
+    def cell_keys( self, icells ):
+        """Return integer keys of cells given their integer indices, an np.ndarray
+        dimensioned n x 3."""
+
+        ncells = int( np.ceil( 1.0 / self.cell_size ) ) + 2
+        icells = icells + ncells
+        width = 2 * ncells + 1
+
+        return ( icells[:,0] * width + icells[:,1] ) * width + icells[:,2]
+
+    def nearest( self, lon0, lat0 ):
+        """Find the footprint nearest to a point with longitude lon0 and latitude
+        lat0 [radians]. The tuple (iscan, ifootprint) of integers is returned."""
+
+        p = np.array( [ np.cos( lon0 ) * np.cos( lat0 ), np.sin( lon0 ) * np.cos( lat0 ), np.sin( lat0 ) ] )
+
+        #  Keys of the 3 x 3 x 3 block of cells surrounding the point, offset in
+        #  integer cell indices from the cell containing the point.
+
+        icenter = self.cell_indices( p.reshape( 1, 3 ) )
+        keys = self.cell_keys( icenter + cell_neighbour_offsets )
+
+        ranges = [ self.cells[k] for k in keys.tolist() if k in self.cells ]
+
+        if len( ranges ) > 0:
+
+            candidates = self.order[ np.concatenate( [ np.arange( i1, i2 ) for i1, i2 in ranges ] ) ]
+            dvec = self.vectors[candidates,:] - p
+            chord2 = np.einsum( "ij,ij->i", dvec, dvec )
+            ibest = chord2.argmin()
+
+            if chord2[ibest] <= self.cell_size**2:
+                iscan, ifootprint = np.unravel_index( candidates[ibest], self.shape )
+                return int( iscan ), int( ifootprint )
+
+        return nearest_footprint( self.lons, self.lats, lon0, lat0 )
@@ -46,6 +46,7 @@ satellite instrument object that inherits this class.
 
 import erfa
 import numpy as np
+from functools import cached_property
 from abc import ABC, abstractmethod
 from sgp4.ext import rv2coe
 from sgp4.api import Satrec
@@ -54,6 +55,8 @@ from astropy.coordinates.builtin_frames.utils import get_polar_motion
 from .awsro import get_occ_times
 from .constants_and_utils import sec_to_sidereal_day, calculate_km_to_degree, mu, calculate_radius_of_earth
 from .spacetrack import Spacetrack
+from .timestandards import Time
+from .kernels import FootprintIndex
 
 #  Exception handling. 
 
@@ -419,9 +422,18 @@ class ScanMetadata():
             number of scans in the returned data set and nfootprints is the number of 
             footprints in each scan.
 
-    'mid_times': list -> numpy.ndarray of numpy.datetime64 objects corresponding to 
-            the middle of the scans in the returned data set. It represents UTC, and 
-            its length is nscans. 
+    'mid_times': list -> List of timestandards.Time objects corresponding to 
+            the middle of the scans in the returned data set. Its length is nscans. 
+            It is generated from mid_times_gps on first access. 
+
+    'mid_times_gps': numpy.ndarray -> Array of GPS seconds corresponding to the 
+            middle of the scans in the returned data set. Its length is nscans. 
+
+    'cos_latitudes': numpy.ndarray -> Cosines of latitudes, computed on first access 
+            and shared by all collocations that search these soundings. 
+
+    'footprint_index': kernels.FootprintIndex -> Spatial index of the soundings for 
+            nearest-sounding searches, built on first access. 
 
     'files': list -> List of file names containing the data. These are the paths to the 
             files containing the nadir-scan satellite data. Its length is nfiles. 
@@ -441,16 +453,51 @@ class ScanMetadata():
     def __init__( self, get_data, longitudes, latitudes, mid_times, 
                  files, file_indices, scan_indices ): 
         """Longitudes and latitudes must be list-like objects in units of radians. 
-        mid_times must be a list of timestandards.Time instances. files is a list of 
-        strings; file_indices a list-like object of integers, as is scan_indices."""
+        mid_times must be either an np.ndarray of GPS seconds or a list of 
+        timestandards.Time instances. files is a list of strings; file_indices a 
+        list-like object of integers, as is scan_indices."""
 
         self.get_data = get_data
-        self.longitudes = np.array( longitudes )
-        self.latitudes = np.array( latitudes )
-        self.mid_times = mid_times
+
+        #  Geolocation arrays are adopted without copying when they are already 
+        #  np.ndarrays; only the windows of them that are searched are read. 
+
+        self.longitudes = np.asarray( longitudes )
+        self.latitudes = np.asarray( latitudes )
+
+        if isinstance( mid_times, np.ndarray ): 
+            self.mid_times_gps = mid_times.astype( np.float64 )
+            self._mid_times = None
+        else: 
+            gps0 = Time( gps=0 )
+            self.mid_times_gps = np.array( [ t - gps0 for t in mid_times ], dtype=np.float64 )
+            self._mid_times = list( mid_times )
+
         self.files = list( files )
-        self.file_indices = np.array( file_indices )
-        self.scan_indices = np.array( scan_indices )
+        self.file_indices = np.asarray( file_indices )
+        self.scan_indices = np.asarray( scan_indices )
+
+    @cached_property
+    def cos_latitudes( self ): 
+        """Cosines of the latitudes of the soundings, dimensioned nscans x nfootprints."""
+
+        return np.cos( self.latitudes )
+
+    @cached_property
+    def footprint_index( self ): 
+        """Spatial index of the soundings, an instance of kernels.FootprintIndex."""
+
+        return FootprintIndex( self.longitudes, self.latitudes )
+
+    @property
+    def mid_times( self ): 
+        """List of timestandards.Time instances for the middle of the scans, 
+        constructed from mid_times_gps on first access."""
+
+        if self._mid_times is None: 
+            self._mid_times = [ Time( gps=t ) for t in self.mid_times_gps ]
+
+        return self._mid_times
 
     def __call__( self, iscan, ifootprint, **kwargs ): 
         """Retrieve a dictionary containing the radiance data for iscan and ifootprint 
@@ -9,10 +9,13 @@ DAAC.  Note that you'll have to create an account on the NASA Earthdata
 server."""
 
 
-import os, re, stat, json, subprocess
+import os, re, stat, json, shutil, subprocess
 import earthaccess
 import requests, netrc, boto3
+import numpy as np
 from platform import system
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from .timestandards import Time
 from .constants_and_utils import defaults_file
@@ -40,15 +43,46 @@ Satellites = {
         }
     }
 
+#  Reverse lookup from satellite alias to the canonical satellite name, the 
+#  key of Satellites. 
+
+alias_to_canonical = { alias: canonical for canonical, v in Satellites.items() for alias in v['aliases'] }
+
 HOME = os.path.expanduser( "~" )
 root_path_variable = "nasa_earthdata_root"
 earthdata_machine = "urs.earthdata.nasa.gov"
 time_limit = timedelta( seconds=3600 )
 
-#  String parsing. 
+#  Number of concurrent threads for downloading granules and moving them 
+#  into the data root. 
+
+download_threads = 8
+
+#  String parsing. Granule file names have the form 
+#  SNDR.<platform>.<instrument>.<yyyymmddTHHMM>.m06...nc. The prefix and 
+#  suffix are checked with str.startswith/str.endswith before the regular 
+#  expression is ever applied. 
+
+file_prefix = "SNDR."
+file_suffix = ".nc"
+file_search_string = r"^SNDR\.[^.]+\.[^.]+\.(\d{8}T\d{4})\.m"
+
+#  Compiled regular expressions, so that patterns are not re-parsed for 
+#  every file encountered in a directory walk. 
+
+file_search_regex = re.compile( file_search_string )
+netrc_machine_regex = re.compile( r"^machine\s+(\S+)" )
 
-file_search_string = r"^SNDR\..*(\d{8}T\d{4})\.m.*\.nc$"
-time_parse_string = "%Y%m%dT%H%M" 
+#  Name of the file in the data root that stores directory listings so that 
+#  unchanged directories need not be re-listed when the inventory is 
+#  regenerated. Each listing records the granule start time, in GPS seconds, 
+#  of each granule file so that it need not be recomputed. 
+
+inventory_cache_file = ".inventory.json"
+
+#  Duration of a granule [s]. 
+
+granule_duration = 6 * 60
 
 #  Establist the netrc file name. 
 
@@ -119,23 +153,26 @@ def setdefaults( root_path=None, earthdatalogin=None ):
 
                 catalog = {}
                 for line in lines: 
-                    m = re.search( r"^machine\s+(\S+)", line )
+                    m = netrc_machine_regex.search( line )
                     if m: 
                         catalog.update( { m.group(1): line.strip() } )
 
-                #  Update catalog to include earthdata. 
+                #  Update catalog to include earthdata. Rewrite the netrc only if 
+                #  the earthdata entry is new or has changed. 
+
+                earthdata_line = "machine {:} login {:} password {:}".format( earthdata_machine, *earthdatalogin ) 
 
-                catalog.update( { earthdata_machine: \
-                        "machine {:} login {:} password {:}".format( earthdata_machine, *earthdatalogin ) 
-                        } )
+                if catalog.get( earthdata_machine ) != earthdata_line: 
 
-                #  Write new netrc. 
+                    catalog.update( { earthdata_machine: earthdata_line } )
 
-                with open( netrc_file, 'w' ) as f: 
-                    for machine, line in catalog.items(): 
-                        f.write( line + "\n" )
+                    #  Write new netrc. 
 
-                os.chmod( netrc_file, stat.S_IRUSR | stat.S_IWUSR )
+                    with open( netrc_file, 'w' ) as f: 
+                        for machine, line in catalog.items(): 
+                            f.write( line + "\n" )
+
+                    os.chmod( netrc_file, stat.S_IRUSR | stat.S_IWUSR )
 
             else: 
 
@@ -200,7 +237,7 @@ def checkdefaults():
         lines = f.readlines()
 
     for line in lines: 
-        m = re.search( r"^machine\s+(\S+)", line )
+        m = netrc_machine_regex.search( line )
         if m: 
             machine = m.group(1)
             if machine == earthdata_machine: 
@@ -230,7 +267,7 @@ def checkdefaults():
 
     #  Check that the data root path has been set. 
 
-    if root_path_variable not in defaults.keys(): 
+    if root_path_variable not in defaults: 
         ret['status'] = "fail"
         ret['messages'].append( "MissingEarthdataRoot" )
         ret['comments'].append( 'Missing data root for NASA Earthdata; be certain to run ' + \
@@ -243,6 +280,122 @@ def checkdefaults():
     return ret
 
 
+def parse_sndr_stamp( s ): 
+    """Convert a granule time stamp of the form YYYYMMDDTHHMM, as found in 
+    SNDR file names, to a datetime.datetime. The format is fixed, so the 
+    fields are sliced directly rather than parsed by datetime.strptime."""
+
+    return datetime( int(s[0:4]), int(s[4:6]), int(s[6:8]), int(s[9:11]), int(s[11:13]) )
+
+
+def granule_start_gps( name ): 
+    """Return the start time, in GPS seconds, of the granule with file name 
+    name, or None if the file name cannot be parsed."""
+
+    m = file_search_regex.search( name )
+    if m is None: 
+        return None
+
+    return Time( utc = parse_sndr_stamp( m.group(1) ) ) - Time( gps=0 )
+
+
+def scan_granule_files( root, cache=None, updated_cache=None ): 
+    """Recursively generate ( path, gps ) for all SNDR granule files under 
+    directory root, gps being the granule start time in GPS seconds. os.scandir is used rather than os.walk so that the file type of each 
+    entry comes from the directory listing itself rather than from a separate 
+    stat call. 
+
+    cache is an optional dictionary, keyed by directory path, of previously 
+    scanned directory listings. A directory is only re-listed if its 
+    modification time differs from that recorded in cache; only then are the 
+    granule start times of its files computed. The listings of all 
+    directories visited are recorded in the dictionary updated_cache if it is 
+    given."""
+
+    mtime = os.stat( root ).st_mtime_ns
+
+    listing = None
+    if cache is not None: 
+        listing = cache.get( root )
+
+    if listing is None or listing['mtime'] != mtime: 
+        subdirs, files = [], []
+        with os.scandir( root ) as entries: 
+            for entry in entries: 
+                if entry.is_dir( follow_symlinks=False ): 
+                    subdirs.append( entry.name )
+                elif entry.is_file( follow_symlinks=False ) and entry.name.startswith( file_prefix ) \
+                        and entry.name.endswith( file_suffix ): 
+                    gps = granule_start_gps( entry.name )
+                    if gps is not None: 
+                        files.append( [ entry.name, gps ] )
+        listing = { 'mtime': mtime, 'subdirs': subdirs, 'files': files }
+
+    if updated_cache is not None: 
+        updated_cache.update( { root: listing } )
+
+    for name, gps in listing['files']: 
+        yield os.path.join( root, name ), gps
+
+    for name in listing['subdirs']: 
+        yield from scan_granule_files( os.path.join( root, name ), cache, updated_cache )
+
+
+def valid_listing( listing ): 
+    """Return True if listing is a well-formed directory listing of the 
+    inventory cache, as generated by scan_granule_files."""
+
+    try: 
+        return isinstance( listing['mtime'], int ) \
+                and all( isinstance( name, str ) for name in listing['subdirs'] ) \
+                and all( isinstance( name, str ) and isinstance( gps, ( int, float ) ) 
+                        for name, gps in listing['files'] )
+    except ( KeyError, TypeError, ValueError ): 
+        return False
+
+
+class GranuleRecord( dict ): 
+    """An inventory record of a granule file, a dictionary with keys 'satellite', 
+    'path', and 'gps_timerange', the granule time range in GPS seconds. The 
+    key 'timerange', the time range as a tuple of two instances of 
+    timestandards.Time, is computed only when it is first accessed."""
+
+    def __missing__( self, key ): 
+
+        if key != "timerange": 
+            raise KeyError( key )
+
+        gps0 = Time( gps=0 )
+        value = tuple( [ gps0 + t for t in self['gps_timerange'] ] )
+        self[key] = value
+
+        return value
+
+
+def granule_record( satellite, path, gps=None ): 
+    """Generate an inventory record for the granule file at path, as an 
+    instance of GranuleRecord. gps is the granule start time in GPS seconds; 
+    it is obtained from the file name if it is not given. None is returned 
+    if the file name cannot be parsed."""
+
+    if gps is None: 
+        gps = granule_start_gps( os.path.basename( path ) )
+        if gps is None: 
+            return None
+
+    rec = GranuleRecord( satellite=satellite, path=path, gps_timerange=( gps, gps + granule_duration ) )
+
+    return rec
+
+
+def canonical_satellite( name ): 
+    """Return the canonical name of a satellite, a key of Satellites, given 
+    any of its aliases. A name that is not a recognized alias is returned 
+    unchanged."""
+
+    return alias_to_canonical.get( name, name )
+
+
 class NASAEarthdata(): 
     """Class to handle interaction with NASA DAACs."""
 
@@ -262,9 +415,12 @@ class NASAEarthdata():
             self.data_root = defaults[root_path_variable]
             os.makedirs( self.data_root, exist_ok=True )
 
-        #  Initialize inventory. 
+        #  Initialize inventory. Directories that have not changed since the 
+        #  last inventory was saved are not re-listed. 
 
         self.inventory = {}
+        self.inventory_arrays = {}
+        self.inventory_cache = self.load_inventory_cache()
         self.regenerate_inventory()
 
         return
@@ -273,47 +429,80 @@ class NASAEarthdata():
         """Create an inventory of the files available on the local file system 
         with ATMS data (as obtained from GES DISC."""
 
-        #  Get list of satellites. 
-
-        instruments = [ p for p in os.listdir( self.data_root ) if os.path.isdir( os.path.join( self.data_root, p ) ) ]
+        updated_cache = {}
+        self.inventory_arrays = {}
 
         #  Loop over instruments. 
 
-        for instrument in instruments: 
+        with os.scandir( self.data_root ) as entries: 
+            instruments = [ e for e in entries if e.is_dir() ]
+
+        for instrument_entry in instruments: 
 
-            data_root = os.path.join( self.data_root, instrument )
+            instrument = instrument_entry.name
 
             #  Initialize inventory. 
 
-            if os.path.isdir( data_root ): 
-                satellites = [ p for p in os.listdir( data_root ) if p in Satellites.keys() \
-                        and os.path.isdir( os.path.join( data_root, p ) ) ]
-            else: 
-                satellites = []
+            with os.scandir( instrument_entry.path ) as entries: 
+                satellites = [ e for e in entries if e.name in Satellites and e.is_dir() ]
 
             if instrument not in self.inventory: 
                 self.inventory.update( { instrument: {} } )
 
             #  Loop over satellites. 
 
-            for sat in satellites: 
+            for sat_entry in satellites: 
 
-                for root, subdirs, files in os.walk( os.path.join( data_root, sat ) ): 
-                    subdirs.sort()
-                    files.sort()
+                sat = sat_entry.name
+                self.inventory[instrument].update( { sat: [] } )
 
-                    if sat not in self.inventory[instrument]: 
-                        self.inventory[instrument].update( { sat: [] } )
+                for path, gps in scan_granule_files( sat_entry.path, self.inventory_cache, updated_cache ): 
+                    self.inventory[instrument][sat].append( granule_record( sat, path, gps ) )
 
-                    for file in files: 
-                        m = re.search( file_search_string, file )
-                        if m is None: 
-                            continue
-                        t1 = Time( utc = datetime.strptime( m.group(1), time_parse_string ) ) 
-                        t2 = t1 + 6 * 60
+        #  Save directory listings for the next instantiation, but only if any 
+        #  directory has changed. 
 
-                        rec = { 'satellite': sat, 'path': os.path.join( root, file ), 'timerange': ( t1, t2 ) }
-                        self.inventory[instrument][sat].append( rec )
+        changed = ( updated_cache != self.inventory_cache )
+        self.inventory_cache = updated_cache
+
+        if changed: 
+            self.save_inventory_cache()
+
+        return
+
+    def load_inventory_cache( self ): 
+        """Read the directory listings saved by the last call to 
+        regenerate_inventory. An empty dictionary is returned, so that all 
+        directories are re-listed, if there is no such file, if it cannot be 
+        read, or if any of its listings is malformed or of an older format."""
+
+        cache_file = os.path.join( self.data_root, inventory_cache_file )
+
+        if not os.path.exists( cache_file ): 
+            return {}
+
+        try: 
+            with open( cache_file, 'r' ) as f: 
+                cache = json.load( f )
+        except ( OSError, ValueError ): 
+            return {}
+
+        if not isinstance( cache, dict ) or not all( valid_listing( listing ) for listing in cache.values() ): 
+            return {}
+
+        return cache
+
+    def save_inventory_cache( self ): 
+        """Write the directory listings of the current inventory to the 
+        inventory cache file in the data root."""
+
+        cache_file = os.path.join( self.data_root, inventory_cache_file )
+
+        try: 
+            with open( cache_file, 'w' ) as f: 
+                json.dump( self.inventory_cache, f )
+        except OSError: 
+            pass
 
         return
 
@@ -322,16 +511,29 @@ class NASAEarthdata():
         satellite name and a time range. The timerange is a two-element 
         tuple/list with instances of timestandards.Time or datetime.datetime. 
         If it is the latter, then the datetime elements are understood to be 
-        UTC."""
+        UTC. The satellite can be given by any of its aliases."""
+
+        #  Check input. 
 
-        #  Check input. Interpret datetime.datetime as timestandards.Time instances 
-        #  if necessary. 
+        satellite = canonical_satellite( satellite )
+        _timerange = self.check_arguments( satellite, instrument, timerange )
 
-        if satellite not in Satellites.keys(): 
+        return self.find_local_paths( satellite, instrument, _timerange )
+
+    def check_arguments( self, satellite, instrument, timerange ): 
+        """Check the satellite, instrument, and timerange arguments of get_paths 
+        and populate. An earthdataError is raised if any are invalid. The 
+        timerange is returned as a list of two instances of timestandards.Time, 
+        converting instances of datetime.datetime (understood to be UTC) if 
+        necessary."""
+
+        satellite_entry = Satellites.get( satellite )
+
+        if satellite_entry is None: 
             raise earthdataError( "InvalidArgument", "The satellite must be one of " + \
                     ", ".join( list( Satellites.keys() ) ) )
 
-        elif instrument not in Satellites[satellite].keys() or instrument == "aliases": 
+        elif instrument not in satellite_entry or instrument == "aliases": 
             raise earthdataError( "InvalidArgument", 
                     f"The instrument {instrument} is not defined for satellite {satellite}" )
 
@@ -349,52 +551,65 @@ class NASAEarthdata():
             raise earthdataError( "InvalidArgument", "The elements of timerange must both be " + \
                     "datetime.datetime or timestandards.Time" )
 
-        ret = []
-        if instrument in self.inventory.keys(): 
-            if satellite in self.inventory[instrument].keys(): 
-                ret = sorted( [ rec['path'] for rec in self.inventory[instrument][satellite] if \
-                        rec['timerange'][0] <= _timerange[1] and rec['timerange'][1] >= _timerange[0] ] )
+        return _timerange
+
+    def find_local_paths( self, satellite, instrument, _timerange ): 
+        """Return a sorted listing of the paths to local data files for an 
+        instrument on a satellite that overlap _timerange. The arguments are 
+        not checked; _timerange must be a 2-element list of instances of 
+        timestandards.Time as returned by check_arguments."""
+
+        #  Compare the time range with the granule time ranges, all as GPS seconds. 
+
+        t1, t2, paths = self.get_inventory_arrays( instrument, satellite )
+
+        gps0 = Time( gps=0 )
+        lo, hi = _timerange[0] - gps0, _timerange[1] - gps0
+        mask = np.logical_and( t1 <= hi, t2 >= lo )
+
+        ret = sorted( [ paths[i] for i in np.flatnonzero( mask ) ] )
 
         return ret
 
+    def get_inventory_arrays( self, instrument, satellite ): 
+        """Return the inventory for an instrument on a satellite as three 
+        parallel sequences: an np.ndarray of granule start times (GPS seconds), 
+        an np.ndarray of granule end times (GPS seconds), and a list of the 
+        paths to the granule files. The arrays are computed once and reused 
+        until the inventory for the instrument and satellite changes."""
+
+        key = ( instrument, satellite )
+
+        if key not in self.inventory_arrays: 
+
+            recs = self.inventory.get( instrument, {} ).get( satellite, [] )
+
+            t1 = np.array( [ rec['gps_timerange'][0] for rec in recs ], dtype=np.float64 )
+            t2 = np.array( [ rec['gps_timerange'][1] for rec in recs ], dtype=np.float64 )
+            paths = [ rec['path'] for rec in recs ]
+
+            self.inventory_arrays.update( { key: ( t1, t2, paths ) } )
+
+        return self.inventory_arrays[key]
+
     def populate( self, satellite, instrument, timerange ): 
         """Download SNPP, JPSS ATMS data that fall within a timerange. 
 
-        * satellite must be one of Satellites.keys(). 
+        * satellite must be one of Satellites.keys() or one of its aliases. 
         * instrument is one of 'atms', 'cris'. 
         * timerange is a 2-element tuple/list of instances of timestandards.Time 
           or instances of datetime.datetime defining the range of times over which 
           to retrieve data. If they are instances of datetime.datetime, then the 
           convention is that they are both UTC."""
 
-        #  Check input. Interpret datetime.datetime as timestandards.Time instances 
-        #  if necessary. 
-
-        if satellite not in Satellites.keys(): 
-            raise earthdataError( "InvalidArgument", "The satellite must be one of " + \
-                    ", ".join( list( Satellites.keys() ) ) )
+        #  Check input. 
 
-        elif instrument not in Satellites[satellite].keys() or instrument == "aliases": 
-            raise earthdataError( "InvalidArgument", 
-                    f"The instrument {instrument} is not defined for satellite {satellite}" )
-
-        if not isinstance( timerange, tuple ) and not isinstance( timerange, list ): 
-            raise earthdataError( "InvalidArgument", "timerange must be a tuple/list of two elements" )
-
-        if len( timerange ) != 2: 
-            raise earthdataError( "InvalidArgument", "timerange must be a tuple/list of two elements" )
-
-        if isinstance( timerange[0], datetime ) and isinstance( timerange[1], datetime ): 
-            _timerange = [ Time( utc=timerange[i] ) for i in range(2) ]
-        elif isinstance( timerange[0], Time ) and isinstance( timerange[1], Time ): 
-            _timerange = timerange
-        else: 
-            raise earthdataError( "InvalidArgument", "The elements of timerange must both be " + \
-                    "datetime.datetime or timestandards.Time" )
+        satellite = canonical_satellite( satellite )
+        _timerange = self.check_arguments( satellite, instrument, timerange )
 
         #  Query the local and remote inventories. 
 
-        local_inventory = self.get_paths( satellite, instrument, _timerange )
+        local_inventory = self.find_local_paths( satellite, instrument, _timerange )
         etimerange = [ _timerange[0], _timerange[1] + 86400 ]
         temporal = tuple( [ t.calendar("utc").datetime().strftime("%Y-%m-%d") for t in etimerange ] ) 
         
@@ -402,31 +617,48 @@ class NASAEarthdata():
 
         #  Get a listing of data files that are available at Earthdata but not in the local inventory. 
 
-        local_basenames = [ os.path.basename( p ) for p in local_inventory ]
+        local_basenames = { os.path.basename( p ) for p in local_inventory }
 
-        get = []
+        candidates, stamps = [], []
         for p in remote_inventory: 
             basename = os.path.basename( p.data_links()[0] )
             if basename in local_basenames: 
                 continue
-            m = re.search( file_search_string, basename )
-            t = Time( utc=datetime.strptime( m.group(1), time_parse_string ) )
-            if t+360 >= _timerange[0] and t <= _timerange[1]: 
-                get.append( p )
+            if not ( basename.startswith( file_prefix ) and basename.endswith( file_suffix ) ): 
+                continue
+            m = file_search_regex.search( basename )
+            if m is None: 
+                continue
+            candidates.append( p )
+            stamps.append( parse_sndr_stamp( m.group(1) ) )
+
+        #  Select granules that overlap the time range, comparing UTC times as 
+        #  numpy.datetime64 all at once. 
+
+        t = np.array( stamps, dtype='datetime64[s]' )
+        lo, hi = [ np.datetime64( tt.calendar("utc").datetime(), 's' ) for tt in _timerange ]
+        select = np.logical_and( t + np.timedelta64( 360, 's' ) >= lo, t <= hi )
+
+        get = [ candidates[i] for i in np.flatnonzero( select ) ]
 
         #  Get data files that we don't yet have. 
 
         if len( get ) > 0: 
 
-            earthaccess.download( get, "tmp" )
+            earthaccess.download( get, "tmp", threads=download_threads )
             files = sorted( [ os.path.join( "tmp", f ) for f in os.listdir( "tmp" ) ] )
 
-            for file in files: 
+            created_dirs = set()
+            created_dirs_lock = Lock()
+
+            def move_one( file ): 
+                """Move one downloaded file into the data root and return its 
+                local path."""
 
                 #  Parse file name for time of granule. 
 
-                m = re.search( file_search_string, os.path.basename(file) )
-                dt = datetime.strptime( m.group(1), time_parse_string )
+                m = file_search_regex.search( os.path.basename(file) )
+                dt = parse_sndr_stamp( m.group(1) )
 
                 #  Define local path for file. 
 
@@ -434,15 +666,42 @@ class NASAEarthdata():
                             f'{dt.year:02d}', f'{dt.month:02d}', f'{dt.day:02d}', 
                             os.path.basename( file ) )
 
-                #  Move file. 
+                #  Move file. Create each day's directory only once. os.replace 
+                #  is a single rename when tmp and the data root are on the same 
+                #  file system; otherwise fall back to a copy and delete. 
 
-                os.makedirs( os.path.dirname( lpath ), exist_ok=True )
-                os.link( file, lpath )
-                os.unlink( file )
+                ldir = os.path.dirname( lpath )
+                with created_dirs_lock: 
+                    if ldir not in created_dirs: 
+                        os.makedirs( ldir, exist_ok=True )
+                        created_dirs.add( ldir )
 
-        #  Regenerate inventory. 
+                try: 
+                    os.replace( file, lpath )
+                except OSError: 
+                    shutil.move( file, lpath )
 
-        self.regenerate_inventory()
+                return lpath
+
+            with ThreadPoolExecutor( max_workers=download_threads ) as executor: 
+                lpaths = list( executor.map( move_one, files ) )
+
+            #  Add to inventory, skipping granules that are already listed. The 
+            #  directory listings in the inventory cache are invalidated by the 
+            #  change in the directory modification time. 
+
+            recs = self.inventory.setdefault( instrument, {} ).setdefault( satellite, [] )
+            listed = { rec['path'] for rec in recs }
+
+            for lpath in lpaths: 
+                if lpath in listed: 
+                    continue
+                rec = granule_record( satellite, lpath )
+                if rec is not None: 
+                    recs.append( rec )
+                    listed.add( lpath )
+
+            self.inventory_arrays.pop( ( instrument, satellite ), None )
 
         return 
 
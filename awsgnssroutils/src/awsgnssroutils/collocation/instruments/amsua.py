@@ -16,6 +16,7 @@ from datetime import datetime
 import xarray 
 
 from ..core.nadir_satellite import NadirSatelliteInstrument, ScanMetadata
+from ..core.collocation import clear_buffered_geolocations
 from ..core.timestandards import Time
 from ..core.eumetsat import eumetsat_time_convention
 from ..core.constants_and_utils import masked_dataarray
@@ -117,6 +118,10 @@ class AMSUA(NadirSatelliteInstrument):
         understanding that the latter is defined as UTC times."""
 
         self.eumetsat_access.populate_metop_amsua( self.satellite_name, timerange )
+
+        #  Geolocations buffered for collocation refinement may predate the new data. 
+
+        clear_buffered_geolocations()
         return
 
     def get_geolocations_from_file( self, filename ):
@@ -197,7 +202,7 @@ class AMSUA(NadirSatelliteInstrument):
             if good.size > 0: 
                 longitudes += [ ret['longitudes'][iy,:] for iy in good ]
                 latitudes += [ ret['latitudes'][iy,:] for iy in good ]
-                mid_times += [ Time(gps=file_gps_times[iy]) for iy in good ]
+                mid_times += [ file_gps_times[iy] for iy in good ]
                 scan_indices += list( good )
                 file_indices += [ifile] * good.size
 
@@ -205,8 +210,9 @@ class AMSUA(NadirSatelliteInstrument):
 
         longitudes = np.array( longitudes )
         latitudes = np.array( latitudes )
+        mid_times = np.array( mid_times, dtype=np.float64 )
 
-        #  Generate output object. 
+        #  Generate output object. Scan times are passed as GPS seconds. 
 
         ret = ScanMetadata( self.get_data, longitudes, latitudes, mid_times, data_files, file_indices, scan_indices )
 
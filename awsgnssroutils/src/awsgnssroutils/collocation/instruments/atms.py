@@ -11,15 +11,18 @@ provided is named by class_name, which inherits the NadirSatelliteInstrument
 class. 
 """
 
+import atexit
+from collections import OrderedDict
 from netCDF4 import Dataset
 import numpy as np
 from datetime import datetime
 import xarray 
 
 from ..core.nadir_satellite import NadirSatelliteInstrument, ScanMetadata
+from ..core.collocation import clear_buffered_geolocations
 from ..core.timestandards import Time, Calendar
 from ..core.eumetsat import eumetsat_time_convention
-from ..core.constants_and_utils import masked_dataarray, planck_blackbody, speed_of_light 
+from ..core.constants_and_utils import planck_blackbody, speed_of_light 
 
 #  REQUIRED attributes 
 
@@ -36,6 +39,11 @@ valid_satellites = [ "Suomi-NPP", "JPSS-1" ]
 
 fill_value = -1.0e20
 
+#  Factor to convert radiances from W m**-2 Hz**-1 ster**-1 to 
+#  mW m**-2 (cm**-1)**-1 ster**-1. 
+
+radiance_scale = 1.0e3 * speed_of_light * 100.0
+
 #  Exception handling. 
 
 class Error( Exception ): 
@@ -47,9 +55,83 @@ class nasa_jpss_error( Error ):
         self.comment = comment
 
 
-#  Buffer for data files. 
+def utc_tuples_to_gps( xtuples ): 
+    """Convert an array of UTC date-time tuples, dimensioned nscans x 8, to an 
+    np.ndarray of GPS seconds of length nscans. The elements of each tuple are 
+    year, month, day, hour, minute, second, millisecond, microsecond, as in 
+    the obs_time_utc variable of the ATMS data files. Tuples with any masked 
+    element are assigned NaN. 
+
+    Only the distinct dates in the file, usually one or two, are converted 
+    by timestandards.Time: each scan's time is the GPS time of midnight UTC 
+    of its own date plus its seconds of day. Leap seconds, written as 
+    second=60, are thereby counted correctly, even in a granule that spans 
+    one."""
+
+    nscans = xtuples.shape[0]
+    ret = np.full( nscans, np.nan, dtype=np.float64 )
+
+    valid = np.flatnonzero( np.logical_not( np.ma.getmaskarray( xtuples[:,0:8] ).any( axis=1 ) ) )
+    if valid.size == 0: 
+        return ret
+
+    v = np.ma.getdata( xtuples[valid,0:8] ).astype( np.int64 )
+
+    #  Distinct dates of the scans. 
+
+    dates = v[:,0] * 10000 + v[:,1] * 100 + v[:,2]
+    udates, first, inverse = np.unique( dates, return_index=True, return_inverse=True )
+
+    #  GPS time of midnight UTC of each distinct date. 
+
+    gps0 = Time(gps=0)
+    gps_midnights = np.array( [ Time( utc=Calendar( *( v[i,0:3] ) ) ) - gps0 for i in first ], dtype=np.float64 )
+
+    ret[valid] = gps_midnights[inverse.reshape(-1)] + v[:,3] * 3600.0 + v[:,4] * 60.0 + v[:,5] \
+            + v[:,6] * 1.0e-3 + v[:,7] * 1.0e-6
+
+    return ret
+
+
+#  Buffer for data files. Up to max_open_data_files data files are kept open, 
+#  keyed by path, with the least recently used closed first. Each entry 
+#  holds the netCDF4.Dataset handle ('pointer') and the channel center 
+#  frequencies [Hz] ('frequencies') of the file, which are read only once. 
+#  get_data adds an xarray.Dataset template ('template') on first use. 
+
+max_open_data_files = 8
+open_data_files = OrderedDict()
+
+
+def close_data_files(): 
+    """Close all buffered data files."""
+
+    while len( open_data_files ) > 0: 
+        path, entry = open_data_files.popitem( last=False )
+        entry['pointer'].close()
+
+    return
+
+atexit.register( close_data_files )
 
-open_data_file = { 'path': None, 'pointer': None }
+
+def open_data_file( path ): 
+    """Return the buffer entry for data file path, a dictionary containing an 
+    open netCDF4.Dataset ('pointer') and the channel center frequencies in Hz 
+    ('frequencies'). The file is opened if necessary."""
+
+    entry = open_data_files.get( path )
+
+    if entry is None: 
+        d = Dataset( path, 'r' )
+        entry = { 'pointer': d, 'frequencies': d.variables['center_freq'][:] * 1.0e6 }
+        open_data_files[path] = entry
+        if len( open_data_files ) > max_open_data_files: 
+            open_data_files.popitem( last=False )[1]['pointer'].close()
+    else: 
+        open_data_files.move_to_end( path )
+
+    return entry
 
 
 class ATMS(NadirSatelliteInstrument):
@@ -118,6 +200,10 @@ class ATMS(NadirSatelliteInstrument):
         understanding that the latter is defined as UTC times."""
 
         self.nasa_earthdata_access.populate( self.satellite_name, 'atms', timerange )
+
+        #  Geolocations buffered for collocation refinement may predate the new data. 
+
+        clear_buffered_geolocations()
         return
 
     def get_geolocations_from_file( self, filename ):
@@ -126,40 +212,36 @@ class ATMS(NadirSatelliteInstrument):
         #  Define time standard for timing information in EUMETSAT Data Store 
         #  AMSU-A level 1a files. Possibilities are "utc", "tai", "gps". 
 
-        #  Open file. 
+        #  Open file. Only three variables are read, so masked-array 
+        #  construction is switched off for longitude and latitude, which 
+        #  are used as raw arrays; obs_time_utc keeps its mask so that scans 
+        #  without valid times can be recognized. 
 
-        d = Dataset( filename, 'r' )
+        with Dataset( filename, 'r' ) as d: 
 
-        #  Get dimensions. 
+            #  Get dimensions. 
 
-        nx = d.dimensions['xtrack'].size
-        ny = d.dimensions['atrack'].size
+            nx = d.dimensions['xtrack'].size
+            ny = d.dimensions['atrack'].size
 
-        #  Get longitudes and latitudes. Convert to radians. 
+            #  Get longitudes and latitudes. Convert to radians in place, keeping 
+            #  single precision, which resolves footprint locations to ~1 m. 
 
-        latitudes = np.deg2rad( d.variables['lat'][:] )
-        longitudes = np.deg2rad( d.variables['lon'][:] )
+            lat_var, lon_var = d.variables['lat'], d.variables['lon']
+            lat_var.set_auto_mask( False )
+            lon_var.set_auto_mask( False )
 
-        #  Get start and stop time of scans in file. 
+            latitudes = np.ascontiguousarray( lat_var[:], dtype=np.float32 )
+            np.multiply( latitudes, np.float32( np.pi/180.0 ), out=latitudes )
 
-        xtuples = d.variables['obs_time_utc'][:,int(nx/2),:]
+            longitudes = np.ascontiguousarray( lon_var[:], dtype=np.float32 )
+            np.multiply( longitudes, np.float32( np.pi/180.0 ), out=longitudes )
 
-        mid_times = []
-        for iscan in range(ny): 
-            if np.any( xtuples[iscan,0:8].mask ): 
-                tt = None
-            else: 
-                tt = Time( utc=Calendar( *( xtuples[iscan,0:6] ) ) ) \
-                        + xtuples[iscan,6]*1.0e-3 + xtuples[iscan,7]*1.0e-6 
-            mid_times.append( tt )
+            #  Get UTC date-time tuples of the middle of the scans in the file. 
 
-        # mid_times = [ Time( utc=Calendar( *( xtuples[iscan,0:6] ) ) ) \
-                # + xtuples[iscan,6]*1.0e-3 + xtuples[iscan,7]*1.0e-6 \
-                # for iscan in range(ny) ]
+            xtuples = d.variables['obs_time_utc'][:,int(nx/2),:]
 
-        d.close()
-
-        return { 'longitudes': longitudes, 'latitudes': latitudes, 'mid_times': mid_times }
+        return { 'longitudes': longitudes, 'latitudes': latitudes, 'obs_time_utc': xtuples }
 
     def get_geolocations( self, timerange ):
         """Load AMSU-A data from a Metop satellite as obtained from the EUMETSAT Data Store
@@ -180,7 +262,8 @@ class ATMS(NadirSatelliteInstrument):
         #  Loop over data files. Keep geolocations only for soundings within the timerange. 
         #  Initialize geolocation variables. 
 
-        longitudes, latitudes, mid_times, scan_indices, file_indices = [], [], [], [], [] 
+        per_file_longitudes, per_file_latitudes, per_file_gps_times = [], [], []
+        per_file_scan_indices, per_file_file_indices = [], []
 
         for ifile, data_file in enumerate(data_files): 
 
@@ -188,41 +271,39 @@ class ATMS(NadirSatelliteInstrument):
 
             ret = self.get_geolocations_from_file( data_file )
 
-            #  Convert mid_times to an np.ndarray of GPS times.  Find times for soundings 
-            #  within the prescribed timerange. 
-
-            xtimes = np.zeros( len(ret['mid_times']), dtype=np.float64 )
-            mask = np.zeros( len(ret['mid_times']), dtype=np.byte )
-
-            for i, t in enumerate( ret['mid_times'] ): 
-                if t is None: 
-                    xtimes[i] = -1001
-                    mask[i] = 1
-                else: 
-                    xtimes[i] = t - gps0
-                    mask[i] = 0
+            #  Convert scan times to an np.ndarray of GPS times.  Find times for soundings 
+            #  within the prescribed timerange. Scans without valid times are NaN. 
 
-            file_gps_times = np.ma.masked_where( mask, xtimes )
+            file_gps_times = utc_tuples_to_gps( ret['obs_time_utc'] )
 
-            good = np.argwhere( np.logical_and( dt[0] <= file_gps_times, file_gps_times < dt[1] ) ).flatten()
+            good = np.flatnonzero( np.logical_and( dt[0] <= file_gps_times, file_gps_times < dt[1] ) )
 
-            #  Keep only those soundings within the prescribed timerange. 
+            #  Keep only those soundings within the prescribed timerange, one 
+            #  contiguous block of scans per file. 
 
             if good.size > 0: 
-                longitudes += [ ret['longitudes'][iy,:] for iy in good ]
-                latitudes += [ ret['latitudes'][iy,:] for iy in good ]
-                mid_times += [ Time(gps=file_gps_times[iy]) for iy in good ]
-                scan_indices += list( good )
-                file_indices += [ifile] * good.size
-
-        #  Convert to ndarrays. 
-
-        longitudes = np.array( longitudes )
-        latitudes = np.array( latitudes )
+                per_file_longitudes.append( ret['longitudes'][good,:] )
+                per_file_latitudes.append( ret['latitudes'][good,:] )
+                per_file_gps_times.append( file_gps_times[good] )
+                per_file_scan_indices.append( good )
+                per_file_file_indices.append( np.full( good.size, ifile ) )
+
+        #  Join the blocks of scans into ndarrays. 
+
+        if len( per_file_longitudes ) > 0: 
+            longitudes = np.concatenate( per_file_longitudes, axis=0 )
+            latitudes = np.concatenate( per_file_latitudes, axis=0 )
+            gps_times = np.concatenate( per_file_gps_times )
+            scan_indices = np.concatenate( per_file_scan_indices )
+            file_indices = np.concatenate( per_file_file_indices )
+        else: 
+            longitudes, latitudes, gps_times, scan_indices, file_indices = \
+                    np.array( [], dtype=np.float32 ), np.array( [], dtype=np.float32 ), np.array( [], dtype=np.float64 ), \
+                    np.array( [], dtype=int ), np.array( [], dtype=int )
 
-        #  Generate output object. 
+        #  Generate output object. Scan times are passed as GPS seconds. 
 
-        ret = ScanMetadata( self.get_data, longitudes, latitudes, mid_times, data_files, file_indices, scan_indices )
+        ret = ScanMetadata( self.get_data, longitudes, latitudes, gps_times, data_files, file_indices, scan_indices )
 
         return ret
 
@@ -256,23 +337,8 @@ class ATMS(NadirSatelliteInstrument):
 
         #  Open data file. 
 
-        global open_data_file
-
-        if open_data_file['pointer'] is not None: 
-            if open_data_file['path'] == file: 
-                #  Data file already open. 
-                d = open_data_file['pointer']
-            else: 
-                #  Close previously opened file. 
-                open_data_file['pointer'].close()
-                open_data_file['path'] = None
-                open_data_file['pointer'] = None
-
-        if open_data_file['path'] is None: 
-            #  Open new file. 
-            open_data_file['path'] = file
-            open_data_file['pointer'] = Dataset( file, 'r' )
-            d = open_data_file['pointer']
+        entry = open_data_file( file )
+        d = entry['pointer']
 
         dim_nscans, dim_nfootprints = d.dimensions['atrack'].size, d.dimensions['xtrack'].size
         nchannels = d.dimensions['channel'].size  
@@ -284,34 +350,52 @@ class ATMS(NadirSatelliteInstrument):
         #  Convert brightness tempereature to radiance. Convert radiances from 
         #  W m**-2 Hz**-1 ster**-1 to mW m**-2 (cm**-1)**-1 ster**-1. 
 
-        frequencies = d.variables['center_freq'][:] * 1.0e6     #  Convert to Hz. 
-        radiances = planck_blackbody( frequencies, brightness_temperature ) \
-                * 1.0e3 * speed_of_light * 100.0 
+        radiances = planck_blackbody( entry['frequencies'], brightness_temperature ) * radiance_scale
 
         zenith = d.variables['sat_zen'][scan_index,footprint_index]
 
-        #  Convert to np.ndarrays. 
+        #  Fill masked values. 
+
+        radiances = np.ma.filled( radiances, radiances.dtype.type( fill_value ) )
+        zenith = np.ma.filled( zenith, zenith.dtype.type( fill_value ) )
+
+        #  The static part of the output dataset --- dimensions, channel 
+        #  coordinate, variable attributes --- is built once per data file 
+        #  and kept in the buffer entry. Each call copies the template 
+        #  shallowly, substituting fresh radiance and zenith arrays, so the 
+        #  datasets returned never share data with one another. 
+
+        template = entry.get( 'template' )
+
+        if template is None: 
+
+            radiance_dataarray = xarray.DataArray( radiances, 
+                    dims=("channel",), 
+                    coords = { 'channel': np.arange(nchannels,dtype=np.int32)+1 } )
+            radiance_dataarray.attrs.update( {
+                'description': "Microwave radiance from ATMS instrument", 
+                'units': "mW m**-2 (cm**-1)**-1 steradian**-1", 
+                '_FillValue': radiances.dtype.type( fill_value ) } )
+
+            zenith_dataarray = xarray.DataArray( zenith )
+            zenith_dataarray.attrs.update( {
+                'description': "Zenith angle from surface to satellite", 
+                'units': "degrees", 
+                '_FillValue': zenith.dtype.type( fill_value ) } )
+
+            template = xarray.Dataset( { 'data': radiance_dataarray, 'zenith': zenith_dataarray } )
+            template.attrs.update( { 
+                'satellite': self.satellite_name, 
+                'instrument': self.instrument_name, 
+                'data_file_path': file } )
 
-        radiance_dataarray = masked_dataarray( radiances, fill_value, 
-                dims=("channel",), 
-                coords = { 'channel': np.arange(nchannels,dtype=np.int32)+1 } )
-        radiance_dataarray.attrs.update( {
-            'description': "Microwave radiance from ATMS instrument", 
-            'units': "mW m**-2 (cm**-1)**-1 steradian**-1" } )
+            entry['template'] = template
 
-        zenith_dataarray = masked_dataarray( zenith, fill_value )
-        zenith_dataarray.attrs.update( {
-            'description': "Zenith angle from surface to satellite", 
-            'units': "degrees" } )
+        ds = template.copy( deep=False, data={ 'data': radiances, 'zenith': zenith } )
 
-        ds_dict = { 
-            'data': radiance_dataarray, 
-            'zenith': zenith_dataarray } 
+        ds_dict = {}
 
         ds_attrs_dict = { 
-            'satellite': self.satellite_name, 
-            'instrument': self.instrument_name, 
-            'data_file_path': file, 
             'scan_index': np.int16( scan_index ), 
             'footprint_index': np.int16( footprint_index ) } 
 
@@ -332,7 +416,7 @@ class ATMS(NadirSatelliteInstrument):
         if time is not None: 
             ds_dict.update( { 'time': time.calendar("utc").isoformat(timespec="milliseconds")+"Z" } )
 
-        ds = xarray.Dataset( ds_dict )
+        ds = ds.assign( ds_dict )
         ds.attrs.update( ds_attrs_dict )
 
         return ds
@@ -169,8 +169,7 @@ def execute_rotation_collocation( missions, datetimerange, ro_processing_center,
         print( "Extracting collocation data" )
 
         tbegin = time()
-        for collocation in collocations_rotation: 
-            occid = collocation.get_data( ro_processing_center )
+        collocations_rotation.get_data( ro_processing_center )
         tend = time()
 
         print( "  - elapsed time = {:10.3f} s".format( tend-tbegin ) )
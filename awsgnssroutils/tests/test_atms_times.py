@@ -0,0 +1,42 @@
+"""Tests of the conversion of ATMS obs_time_utc tuples to GPS seconds."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip( "astropy" )
+pytest.importorskip( "netCDF4" )
+atms = pytest.importorskip( "awsgnssroutils.collocation.instruments.atms" )
+
+from awsgnssroutils.collocation.core.timestandards import Time, Calendar
+
+
+def test_utc_tuples_to_gps_across_leap_second(): 
+    """Scans straddling the leap second at the end of 2016 are one second apart."""
+
+    xtuples = np.ma.array( [ 
+        [ 2016, 12, 31, 23, 59, 58, 500, 0 ], 
+        [ 2016, 12, 31, 23, 59, 59, 500, 0 ], 
+        [ 2016, 12, 31, 23, 59, 60, 500, 0 ], 
+        [ 2017,  1,  1,  0,  0,  0, 500, 0 ], 
+        [ 2017,  1,  1,  0,  0,  1, 500, 0 ] ], dtype=np.int32 )
+
+    gps = atms.utc_tuples_to_gps( xtuples )
+
+    np.testing.assert_allclose( np.diff( gps ), 1.0 )
+
+    gps0 = Time(gps=0)
+    np.testing.assert_allclose( gps[3], Time( utc=Calendar(2017,1,1) ) - gps0 + 0.5 )
+    np.testing.assert_allclose( gps[0], Time( utc=Calendar(2016,12,31) ) - gps0 + 86398.5 )
+
+
+def test_utc_tuples_to_gps_masked(): 
+    """Scans with any masked time element are NaN."""
+
+    xtuples = np.ma.array( [ 
+        [ 2020, 6, 1, 12, 0, 0, 0, 0 ], 
+        [ 2020, 6, 1, 12, 0, 8, 0, 0 ] ], dtype=np.int32 )
+    xtuples[1,4] = np.ma.masked
+
+    gps = atms.utc_tuples_to_gps( xtuples )
+
+    assert np.isfinite( gps[0] ) and np.isnan( gps[1] )
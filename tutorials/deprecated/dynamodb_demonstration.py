@@ -29,6 +29,8 @@ The prerequisite nonstandard python modules that must be installed are
   * cartopy
   * boto3
 
+and orjson is used if it is installed.
+
 Before any of this code is implemented, it is first necessary to manifest
 the DynamoDB database using the utilities in import_gnss-ro_dynamoDB.py. The user only need
 modify a few parameters in the "IMPORTANT: Configuration" section below
@@ -58,6 +60,15 @@ aws_profile = None
 aws_region = "us-east-1"
 dynamodb_table = "gnss-ro-data-stagingv1_1"
 
+#  Define the name of a global secondary index of the DynamoDB database
+#  table with partition key "yyyy-mm" (year-month of the sounding) and
+#  sort key "date-time", if one has been provisioned. With it, the
+#  soundings of a day are retrieved by a single query rather than one
+#  query per satellite and transmitter. Set to None if there is no such
+#  index.
+
+month_index = None
+
 ##################################################
 #  Configuration complete.
 ##################################################
@@ -68,18 +79,31 @@ dynamodb_table = "gnss-ro-data-stagingv1_1"
 import os
 import sys
 import json
+import mmap
+import functools
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 #  Import installed modules.
 
 from netCDF4 import Dataset
 import numpy as np
-import cartopy
 import matplotlib.cm as cm
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MultipleLocator
 import boto3
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.config import Config
+
+#  orjson is optional; it parses JSON several times faster than json.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 #  The RO missions in the data archive with pointers to the names
 #  of the satellites in each RO mission. This dictionary is a summary
@@ -102,6 +126,12 @@ valid_missions = {
     'geoopt': [ "geooptG{:02d}".format(i) for i in range(1,8) ]
     }
 
+#  The inverse of valid_missions: the RO mission of each satellite. The
+#  satellite is the first element of a partition key.
+
+satellite_missions = { satellite: mission
+        for mission, satellites in valid_missions.items() for satellite in satellites }
+
 #  Matplotlib default settings.
 
 axeslinewidth = 0.5
@@ -123,10 +153,47 @@ plt.rcParams.update( {
 # valid_constellations = [ "G", "R" ]
 valid_constellations = [ "G", "R", "E" ]
 
-#  Intermediate files: mission color table.
+#  Number of PRNs in each GNSS constellation.
+
+constellation_nprns = { "G": 32, "R": 24, "E": 36, "C": 61 }
+
+#  Method of counting occultations in occultation_count_by_mission. By
+#  default, the count of every GPS and GLONASS partition key is queried.
+#  If count_by_scan is True, the table is instead scanned once per month in
+#  scan_segments concurrent segments, filtering on the sort key. A scan is
+#  charged for every item it reads, before filtering, so each month reads
+#  the entire table; it pays only for small tables.
+
+count_by_scan = False
+scan_segments = 16
+
+#  Number of concurrent threads querying partition keys in
+#  occultation_count_by_mission and distribution_solartime_figure.
+
+query_threads = 48
+
+#  Number of processes counting occultations for different months
+#  concurrently in occultation_count_by_mission.
+
+count_processes = 8
 
+#  The botocore configuration of the DynamoDB connections: the connection
+#  pool must be at least as large as the number of threads, and throttled
+#  requests are retried adaptively.
+
+dynamodb_config = Config( max_pool_connections=64,
+        retries={ 'max_attempts': 10, 'mode': 'adaptive' } )
+
+#  Intermediate files: occultation counts by mission and month, as written
+#  by occultation_count_by_mission, and mission color table.
+
+alldata_json_file = "occultation_count_by_mission.ndjson"
 colors_json_file = "color_table_by_mission.json"
 
+#  Format of the sort key "date-time" of the DynamoDB database table.
+
+sortkey_format = "%Y-%m-%d-%H-%M"
+
 #  Define month labeling strings.
 
 monthstrings = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
@@ -166,25 +233,121 @@ def latlabels( lats ):
 
     return ylabels
 
+@functools.lru_cache( maxsize=None )
+def get_transmitters_cached( constellations ):
+    """Compute get_transmitters for constellations, a sorted tuple of GNSS
+    constellation letters. The result is computed once for each
+    constellations."""
+
+    transmitters = [ f"{constellation}{prn:02d}" for constellation in constellations
+            for prn in range( 1, constellation_nprns[constellation]+1 ) ]
+
+    return tuple( sorted( transmitters ) )
+
 def get_transmitters( constellations ):
-    """Return a list of possible transmitter names as 3-character PRNs"""
+    """Return a tuple of possible transmitter names as 3-character PRNs, sorted,
+    for constellations, any iterable of GNSS constellation letters such as
+    valid_constellations."""
+
+    return get_transmitters_cached( tuple( sorted( set( constellations ) ) ) )
+
+#  The GPS and GLONASS transmitters.
+
+gps_glonass_transmitters = get_transmitters( ( "G", "R" ) )
+gps_glonass_transmitters_set = frozenset( gps_glonass_transmitters )
+
+#  All partition keys of GPS and GLONASS soundings, each paired with its
+#  RO mission.
+
+all_partitionkeys = [ ( mission, f"{satellite}-{transmitter}" )
+        for mission, satellites in valid_missions.items()
+        for satellite in satellites for transmitter in gps_glonass_transmitters ]
 
-    transmitters = []
-    for constellation in constellations:
-        if constellation == "G":
-            nprns = 32
-        elif constellation == "R":
-            nprns = 24
-        elif constellation == "E":
-            nprns = 36
-        elif constellation == "C":
-            nprns = 61
-        transmitters += [ f"{constellation}{prn:02d}" for prn in range(1,nprns+1) ]
 
-    transmitters.sort()
+def json_loads( contents ):
+    """Parse a JSON document, with orjson if it is installed. contents can be
+    bytes or a memoryview of bytes, which orjson parses without copying."""
 
-    return transmitters
+    if orjson is None:
+        return json.loads( bytes( contents ) )
+    else:
+        return orjson.loads( contents )
+
+def json_dumps_line( obj ):
+    """Serialize obj as one line of newline-delimited JSON (NDJSON), returned
+    as bytes."""
+
+    if orjson is None:
+        return ( json.dumps( obj ) + "\n" ).encode()
+    else:
+        return orjson.dumps( obj, option=orjson.OPT_APPEND_NEWLINE )
+
+@functools.lru_cache( maxsize=4 )
+def load_json_cached( path, mtime, records=False ):
+    """Parse the JSON file path. The modification time mtime of the file is
+    part of the cache key, so that the file is parsed again only when it
+    changes. If records is true, the file is a sequence of records, either as
+    newline-delimited JSON (NDJSON) or, in older files, as a JSON array, and a
+    list of the records is returned."""
+
+    #  Map the file into memory rather than reading it into a buffer.
+
+    with open( path, 'rb' ) as fp:
+
+        if os.fstat( fp.fileno() ).st_size == 0:
+            return [] if records else json_loads( b"" )
+
+        with mmap.mmap( fp.fileno(), 0, access=mmap.ACCESS_READ ) as mm:
+
+            if records and mm[:64].lstrip()[:1] != b"[":
+                return [ json_loads( line ) for line in iter( mm.readline, b"" ) if line.strip() ]
+
+            with memoryview( mm ) as view:
+                return json_loads( view )
+
+def load_json( path ):
+    """Return the contents of the JSON file path, parsing it only if it has
+    not been parsed since it was last modified. The contents should not be
+    modified by the caller."""
+
+    return load_json_cached( path, os.path.getmtime( path ) )
+
+def load_records( path ):
+    """Return the list of records in path, a file of occultation counts as
+    written by occultation_count_by_mission, parsing it only if it has not
+    been parsed since it was last modified. The records should not be
+    modified by the caller."""
 
+    return load_json_cached( path, os.path.getmtime( path ), records=True )
+
+def truncate_partial_record( path ):
+    """Remove the last record of the newline-delimited JSON file path if it was
+    cut short, as by an interrupted write: if the last line does not parse,
+    the file is truncated back to the end of the line before it. A file that
+    starts with a JSON array is left alone. Return True if the file was
+    truncated."""
+
+    with open( path, 'rb+' ) as fp:
+
+        contents = fp.read().rstrip()
+        if len( contents ) == 0 or contents.lstrip().startswith( b"[" ):
+            return False
+
+        istart = contents.rfind( b"\n" ) + 1
+
+        try:
+            json_loads( contents[istart:] )
+        except ValueError:
+            fp.truncate( istart )
+        else:
+            return False
+
+    #  The file changed, perhaps within the resolution of its modification
+    #  time, so forget any parsed contents.
+
+    load_json_cached.cache_clear()
+
+    return True
 
 def merge_jsonfiles( jsonfiles, output_jsonfile=None ):
     """Merge together the contents of multiple json files generated by
@@ -195,8 +358,7 @@ def merge_jsonfiles( jsonfiles, output_jsonfile=None ):
 
     alldata_tmp = []
     for jsonfile in jsonfiles:
-        with open( jsonfile, 'r' ) as fp:
-            alldata_tmp += json.load( fp )
+        alldata_tmp += load_records( jsonfile )
 
     #  Sort the data.
 
@@ -211,92 +373,234 @@ def merge_jsonfiles( jsonfiles, output_jsonfile=None ):
     #  Write to output if requested.
 
     if output_jsonfile is not None:
-        with open( output_jsonfile, 'w' ) as e:
-            json.dump( alldata, e )
+        with open( output_jsonfile, 'wb' ) as e:
+            for rec in alldata:
+                e.write( json_dumps_line( rec ) )
 
     #  Done.
 
     return alldata
 
 
+#  DynamoDB table handles, one per thread, because boto3 sessions and
+#  resources are neither thread-safe nor fork-safe.
+
+thread_local = threading.local()
+
+
+def get_table():
+    """Return a handle to the DynamoDB table dynamodb_table for the calling
+    thread and process, creating it if necessary."""
+
+    table = getattr( thread_local, "table", None )
+
+    if table is None or thread_local.pid != os.getpid():
+
+        #  AWS access. Be sure to establish authentication for profile aws_profile
+        #  for successful use.
+
+        if aws_profile is None:
+            session = boto3.Session( region_name=aws_region )
+        else:
+            session = boto3.Session( profile_name=aws_profile, region_name=aws_region )
+
+        resource = session.resource( "dynamodb", config=dynamodb_config )
+        table = resource.Table( dynamodb_table )
+        thread_local.table = table
+        thread_local.pid = os.getpid()
+
+    return table
+
+
+def query_items( partitionkey, date_condition ):
+    """Query the database for all soundings with partition key partitionkey
+    and sort keys satisfying date_condition, a key condition on "date-time"
+    such as Key('date-time').between( sortkey1, sortkey2 ) that is built once
+    and shared by all queries, following the pages of the query. Only the
+    geolocation attributes of the items are retrieved. A list of the items
+    is returned."""
+
+    table = get_table()
+    kwargs = {
+            'KeyConditionExpression': Key('leo-ttt').eq( partitionkey ) & date_condition,
+            'ProjectionExpression': "longitude, latitude, local_time" }
+
+    items = []
+
+    while True:
+        ret = table.query( **kwargs )
+        items += ret['Items']
+        if 'LastEvaluatedKey' not in ret:
+            break
+        kwargs['ExclusiveStartKey'] = ret['LastEvaluatedKey']
+
+    return items
+
+
+def count_one( partitionkey, date_condition ):
+    """Query the database for the number of soundings with partition key
+    partitionkey and sort keys satisfying date_condition, a key condition on
+    "date-time". Only the count is requested, so no items are transferred. A
+    query reads at most 1 MB per page, so the counts of all pages are summed."""
+
+    table = get_table()
+    kwargs = {
+            'KeyConditionExpression': Key('leo-ttt').eq( partitionkey ) & date_condition,
+            'Select': 'COUNT' }
+
+    count = 0
+
+    while True:
+        ret = table.query( **kwargs )
+        count += ret['Count']
+        if 'LastEvaluatedKey' not in ret:
+            break
+        kwargs['ExclusiveStartKey'] = ret['LastEvaluatedKey']
+
+    return count
+
+
+def scan_segment( segment, condition ):
+    """Scan one of scan_segments segments of the database for soundings that
+    satisfy the filter condition and count them by satellite, the first
+    element of the partition key. Only soundings of GPS and GLONASS
+    transmitters, the last element of the partition key, are counted, as
+    when querying. Only the partition key is projected. A scan reads at
+    most 1 MB per page, so all pages are scanned. A Counter of soundings by
+    satellite is returned."""
+
+    table = get_table()
+    kwargs = {
+            'Segment': segment,
+            'TotalSegments': scan_segments,
+            'FilterExpression': condition,
+            'ProjectionExpression': "#l",
+            'ExpressionAttributeNames': { "#l": "leo-ttt" } }
+
+    counts = Counter()
+
+    while True:
+        ret = table.scan( **kwargs )
+        for item in ret['Items']:
+            satellite, transmitter = item['leo-ttt'].rsplit( "-", 1 )
+            if transmitter in gps_glonass_transmitters_set:
+                counts[satellite] += 1
+        if 'LastEvaluatedKey' not in ret:
+            break
+        kwargs['ExclusiveStartKey'] = ret['LastEvaluatedKey']
+
+    return counts
+
+
 ################################################################################
 #  Methods.
 ################################################################################
 
-def occultation_count_by_mission( first_year, last_year, output_json ):
-    """Count occultations by mission and by month, then output to
-    output_json."""
+def count_month( yearmonth ):
+    """Count occultations by mission for one month, given as the tuple
+    yearmonth = ( year, month ), and return the month record. The count of
+    each GPS and GLONASS partition key is queried by query_threads
+    concurrent threads or, if count_by_scan is True, the database is
+    scanned in scan_segments concurrent segments."""
 
-    #  AWS access. Be sure to establish authentication for profile aws_profile
-    #  for successful use.
+    year, month = yearmonth
 
-    if aws_profile is None:
-        session = boto3.Session( region_name=aws_region )
-    else:
-        session = boto3.Session( profile_name=aws_profile, region_name=aws_region )
+    #  Define sort key range.
 
-    resource = session.resource( "dynamodb" )
-    table = resource.Table( dynamodb_table )
+    dtime1 = datetime( year, month, 1 )
+    dtime2 = dtime1 + timedelta( days=31 )
+    dtime2 = datetime( dtime2.year, dtime2.month, 1 ) - timedelta( minutes=1 )
 
-    #  Get list of transmitters.
+    sortkey1 = dtime1.strftime( sortkey_format )
+    sortkey2 = dtime2.strftime( sortkey_format )
 
-    transmitters = get_transmitters( [ "G", "R" ] )
+    LOGGER.info( f"Working on {year=}, {month=}" )
 
-    #  Initialize and loop over year-month.
+    #  Initialize new year-month record, with an occultation counter
+    #  for each mission.
 
-    alldata = []
+    rec = { 'year': year, 'month': month,
+           'noccs': { mission: 0 for mission in valid_missions.keys() } }
+
+    if count_by_scan:
+
+        #  Scan the database and count the soundings by satellite, then
+        #  by mission.
+
+        condition = Attr('date-time').between( sortkey1, sortkey2 )
+
+        with ThreadPoolExecutor( max_workers=scan_segments ) as executor:
+            counts = sum( executor.map( lambda segment: scan_segment( segment, condition ),
+                    range( scan_segments ) ), Counter() )
+
+        for satellite, count in counts.items():
+            if satellite in satellite_missions:
+                rec['noccs'][satellite_missions[satellite]] += count
+
+    else:
+
+        #  Query the database for the count of each partition key.
 
-    for year in range(first_year,last_year+1):
-        for month in range(1,13):
+        date_condition = Key('date-time').between( sortkey1, sortkey2 )
 
-            #  Define sort key range.
+        with ThreadPoolExecutor( max_workers=query_threads ) as executor:
+            counts = executor.map( lambda task: count_one( task[1], date_condition ), all_partitionkeys )
+            for ( mission, partitionkey ), count in zip( all_partitionkeys, counts ):
+                rec['noccs'][mission] += count
 
-            dtime1 = datetime( year, month, 1 )
-            dtime2 = dtime1 + timedelta( days=31 )
-            dtime2 = datetime( dtime2.year, dtime2.month, 1 ) - timedelta( minutes=1 )
+    LOGGER.info( "Record: " + json.dumps( rec ) )
 
-            sortkey1 = "{:4d}-{:02d}-{:02d}-{:02d}-{:02d}".format(
-                    dtime1.year, dtime1.month, dtime1.day, dtime1.hour, dtime1.minute )
-            sortkey2 = "{:4d}-{:02d}-{:02d}-{:02d}-{:02d}".format(
-                    dtime2.year, dtime2.month, dtime2.day, dtime2.hour, dtime2.minute )
+    return rec
 
-            #  Initialize new year-month record.
 
-            rec = { 'year': year, 'month': month, 'noccs': {} }
+def occultation_count_by_mission( first_year, last_year, output_json ):
+    """Count occultations by mission and by month, then output to
+    output_json. The output is newline-delimited JSON (NDJSON), one record
+    per month, each appended as soon as its month has been counted. The
+    months are counted concurrently by count_processes processes. If
+    output_json already exists, the months it contains are not counted
+    again, so that an interrupted count can be resumed."""
 
-            #  Loop over partition keys. The first element of the partition key is a
-            #  satellite identifier, which are given in the valid_missions definitions.
+    #  Read the records of months already counted, dropping a last record
+    #  left incomplete by an interrupted run. The file is rewritten as NDJSON
+    #  in case it is an older JSON-array file.
 
-            for mission, satellites in valid_missions.items():
+    previous = []
 
-                LOGGER.info( f"Working on {year=}, {month=}, {mission=}" )
+    if os.path.isfile( output_json ):
+        if truncate_partial_record( output_json ):
+            LOGGER.warning( f"Dropped an incomplete last record from {output_json}." )
+        previous = list( load_records( output_json ) )
+        LOGGER.info( f"Resuming with {len(previous)} months already in {output_json}." )
+        with open( output_json, 'wb' ) as out:
+            for rec in previous:
+                out.write( json_dumps_line( rec ) )
 
-                #  Initialize the occultation counter for this mission-year-month.
+    done = { ( rec['year'], rec['month'] ) for rec in previous }
 
-                rec['noccs'].update( { mission: 0 } )
+    yearmonths = [ ( year, month ) for year in range(first_year,last_year+1) for month in range(1,13)
+            if ( year, month ) not in done ]
 
-                for satellite in satellites:
-                    for transmitter in transmitters:
-                        partitionkey = f"{satellite}-{transmitter}"
+    #  Initialize and loop over year-month. The month records are returned
+    #  in order.
 
-                        #  Query the database and count the soundings.
+    alldata = [ rec for rec in previous if first_year <= rec['year'] <= last_year ]
 
-                        ret = table.query(
-                                KeyConditionExpression =
-                                    Key('leo-ttt').eq( partitionkey ) &
-                                    Key('date-time').between( sortkey1, sortkey2 )
-                                )
-                        rec['noccs'][mission] += ret['Count']
+    LOGGER.info( f"Writing data counts to {output_json}." )
 
-            LOGGER.info( "Record: " + json.dumps( rec ) )
+    with multiprocessing.Pool( count_processes ) as pool:
 
-            #  Append the month record to the alldata list.
+        for rec in pool.imap( count_month, yearmonths ):
+
+            #  Append the month record to the output file and to the alldata
+            #  list. The file is open only while writing.
+
+            with open( output_json, 'ab' ) as out:
+                out.write( json_dumps_line( rec ) )
 
             alldata.append( rec )
 
-    with open( output_json, 'w' ) as out:
-        LOGGER.info( f"Writing data counts to {output_json}." )
-        json.dump( alldata, out, indent="  " )
+    alldata.sort( key=lambda rec: ( rec['year'], rec['month'] ) )
 
     return alldata
 
@@ -307,48 +611,38 @@ def occultation_count_figure( alldata, epsfile, yticks=np.arange(0,5001,1000), y
     epsfile. yticks is a numpy array of the major y tick marks, and yminor
     is the interval for minor ticks on the y axis."""
 
-    #  Find the start dates of counts for each mission.
+    #  Pivot the counts into an array dimensioned missions x months.
 
     missions = list( alldata[0]['noccs'].keys() )
-    start_months = [ None for m in missions ]
+    allcounts = np.array( [ [ rec['noccs'].get( mission, 0 ) for mission in missions ] for rec in alldata ],
+            dtype='f' ).reshape( len(alldata), len(missions) ).T
 
-    for rec in alldata:
-        for im, m in enumerate( missions ):
-            if start_months[im] is None and rec['noccs'][m] != 0:
-                start_months[im] = rec['year'] + ( rec['month'] - 0.5 ) / 12.0
+    #  Year, month, and fractional year of each record.
 
-    #  Eliminate missions without data.
+    years = np.fromiter( ( rec['year'] for rec in alldata ), dtype=np.int32, count=len(alldata) )
+    months = np.fromiter( ( rec['month'] for rec in alldata ), dtype=np.int32, count=len(alldata) )
+    times = years + ( months - 0.5 ) / 12.0
 
-    smissions, sstarts = [], []
-    for i, m in enumerate( missions ):
-        if start_months[i] is not None:
-            smissions.append( m )
-            sstarts.append( start_months[i] )
+    #  Find the start dates of counts for each mission, eliminate missions
+    #  without data, and sort the missions by start date.
 
-    #  Sort start months.
+    nonzero = ( allcounts != 0 )
+    has_data = nonzero.any( axis=1 )
+    start_months = times[ np.argmax( nonzero, axis=1 ) ]
 
-    isort = np.argsort( sstarts )
-    missions = []
-    for i in isort:
-        missions.append( smissions[i] )
+    isort = np.flatnonzero( has_data )[ np.argsort( start_months[has_data], kind="stable" ) ]
+    missions = np.asarray( missions, dtype=object )[isort].tolist()
 
     nmissions = isort.size
 
     #  Now resort the data.
 
-    counts = np.zeros( (nmissions, len(alldata)), dtype='f' )
-    times = np.array( [ rec['year'] + ( rec['month'] - 0.5 ) / 12.0 for rec in alldata ] )
-
-    for irec, rec in enumerate( alldata ):
-        for imission, mission in enumerate( missions ):
-            counts[imission,irec] = rec['noccs'][mission]
+    counts = allcounts[isort,:]
 
     #  Normalize counts by days in each month.
 
     ndays = np.array( [ 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31 ], dtype='f' )
-    for i, rec in enumerate( alldata ):
-        imonth = rec['month'] - 1
-        counts[:,i] /= ndays[imonth]
+    counts /= ndays[months-1]
 
     #  Maximum number of occultations per month.
 
@@ -410,20 +704,17 @@ def distribution_solartime_figure( year, month, day, epsfile ):
     one day of soundings as specified by year, month, day. The figure is saved
     as encapsulated output to epsfile."""
 
-    #  Set up session and dynamodb table.
+    #  cartopy is slow to import and is needed only here.
 
-    if aws_profile is None:
-        session = boto3.Session( region_name=aws_region )
-    else:
-        session = boto3.Session( profile_name=aws_profile, region_name=aws_region )
+    import cartopy.crs as ccrs
 
-    resource = session.resource( "dynamodb" )
-    table = resource.Table( dynamodb_table )
+    #  Set up dynamodb table.
+
+    table = get_table()
 
     #  Which missions have data for this month?
 
-    with open( alldata_json_file, 'r' ) as d:
-        alldata = json.load( d )
+    alldata = load_records( alldata_json_file )
 
     for rec in alldata:
         if rec['year'] == year and rec['month'] == month:
@@ -434,54 +725,93 @@ def distribution_solartime_figure( year, month, day, epsfile ):
 
     maprecs = []
 
-    #  Get list of transmitters.
-
-    transmitters = get_transmitters( [ "G", "R" ] )
-
     #  Define sort key range.
 
     dtime1 = datetime( year, month, day )
     dtime2 = dtime1 + timedelta( minutes=1439 )
 
-    sortkey1 = "{:4d}-{:02d}-{:02d}-{:02d}-{:02d}".format(
-            dtime1.year, dtime1.month, dtime1.day, dtime1.hour, dtime1.minute )
-    sortkey2 = "{:4d}-{:02d}-{:02d}-{:02d}-{:02d}".format(
-            dtime2.year, dtime2.month, dtime2.day, dtime2.hour, dtime2.minute )
+    sortkey1 = dtime1.strftime( sortkey_format )
+    sortkey2 = dtime2.strftime( sortkey_format )
+    date_condition = Key('date-time').between( sortkey1, sortkey2 )
+
+    #  Retrieve the soundings of the day in pages of items by mission.
+
+    pages = { mission: [] for mission in missions }
+
+    if month_index is not None:
+
+        #  Query the month index for all soundings of the day at once, then
+        #  sort the items by mission according to the satellite identifier at
+        #  the head of the partition key. Keep only GPS and GLONASS
+        #  transmitters, as the per-partition-key queries do.
+
+        kwargs = {
+                'IndexName': month_index,
+                'KeyConditionExpression':
+                    Key('yyyy-mm').eq( f"{year:04d}-{month:02d}" ) &
+                    date_condition,
+                'ProjectionExpression': "longitude, latitude, local_time, #l",
+                'ExpressionAttributeNames': { "#l": "leo-ttt" } }
+
+        while True:
+            ret = table.query( **kwargs )
+            for item in ret['Items']:
+                satellite, transmitter = item['leo-ttt'].rsplit( "-", 1 )
+                if transmitter not in gps_glonass_transmitters_set:
+                    continue
+                mission = satellite_missions.get( satellite )
+                if mission in pages:
+                    pages[mission].append( item )
+            if 'LastEvaluatedKey' not in ret:
+                break
+            kwargs['ExclusiveStartKey'] = ret['LastEvaluatedKey']
+
+        for mission in missions:
+            pages[mission] = [ pages[mission] ]
+
+    else:
+
+        #  Query the database for each partition key of each mission,
+        #  concurrently.
+
+        tasks = [ ( mission, partitionkey ) for mission, partitionkey in all_partitionkeys if mission in pages ]
+
+        with ThreadPoolExecutor( max_workers=query_threads ) as executor:
+            results = executor.map( lambda task: query_items( task[1], date_condition ), tasks )
+            for ( mission, partitionkey ), items in zip( tasks, results ):
+                pages[mission].append( items )
 
     #  Loop over missions.
 
-    for mission, satellites in valid_missions.items():
+    for mission in valid_missions.keys():
 
         if mission not in missions: continue
 
-        #  For each mission-year-month, retrieve all soundings, decimate, and retain
-        #  geolocation information.
+        #  For each mission-year-month, retain geolocation information.
+
+        longitudes, latitudes, solartimes = [], [], []
+
+        for items in pages[mission]:
+
+            if len( items ) != 0:
 
-        rec = { 'mission': mission, 'longitudes': [], 'latitudes': [], 'solartimes': [] }
-        noccs = 0
+                #  Convert to arrays, the numbers being returned by DynamoDB as
+                #  Decimals, and mask out missing values.
 
-        for satellite in satellites:
-            for transmitter in transmitters:
-                partitionkey = f"{satellite}-{transmitter}"
+                lons = np.fromiter( ( item['longitude'] for item in items ), dtype=np.float64, count=len(items) )
+                lats = np.fromiter( ( item['latitude'] for item in items ), dtype=np.float64, count=len(items) )
+                lts = np.fromiter( ( item['local_time'] for item in items ), dtype=np.float64, count=len(items) )
 
-                #  Query the database.
+                good = ( lons != -999.99 ) & ( lats != -999.99 ) & ( lts != -999.99 )
 
-                ret = table.query(
-                        KeyConditionExpression =
-                            Key('leo-ttt').eq( partitionkey ) &
-                            Key('date-time').between( sortkey1, sortkey2 )
-                        )
+                longitudes.append( lons[good] )
+                latitudes.append( lats[good] )
+                solartimes.append( lts[good] )
 
-                if ret['Count'] != 0:
-                    for item in ret['Items']:
-                        if float( item['longitude'] ) == -999.99 \
-                                or float( item['latitude'] ) == -999.99 \
-                                or float( item['local_time'] ) == -999.99 :
-                            continue
-                        rec['longitudes'].append( float( item['longitude'] ) )
-                        rec['latitudes'].append( float( item['latitude'] ) )
-                        rec['solartimes'].append( float( item['local_time'] ) )
-                        noccs += 1
+        rec = { 'mission': mission,
+               'longitudes': np.concatenate( longitudes ) if len( longitudes ) > 0 else np.zeros( 0 ),
+               'latitudes': np.concatenate( latitudes ) if len( latitudes ) > 0 else np.zeros( 0 ),
+               'solartimes': np.concatenate( solartimes ) if len( solartimes ) > 0 else np.zeros( 0 ) }
 
         maprecs.append( rec )
 
@@ -492,8 +822,7 @@ def distribution_solartime_figure( year, month, day, epsfile ):
                 "generated by occultation_count_figure beforehand." )
         return
 
-    with open( colors_json_file, 'r' ) as c:
-        colormap = json.load( c )
+    colormap = load_json( colors_json_file )
 
     #  Execute map.
 
@@ -501,7 +830,7 @@ def distribution_solartime_figure( year, month, day, epsfile ):
 
     #  Longitude-latitude map.
 
-    ax = fig.add_axes( [0.01,0.22,0.45,0.67], projection=cartopy.crs.PlateCarree() )
+    ax = fig.add_axes( [0.01,0.22,0.45,0.67], projection=ccrs.PlateCarree() )
     ax.coastlines( )
 
     ax.set_xlim( -180, 180 )
@@ -514,7 +843,7 @@ def distribution_solartime_figure( year, month, day, epsfile ):
 
     for rec in maprecs:
         color = colormap[rec['mission']]
-        ax.scatter( rec['longitudes'], rec['latitudes'], color=color, s=0.25 )
+        ax.scatter( rec['longitudes'], rec['latitudes'], color=color, s=0.25, rasterized=True )
 
     #  Next axis: solar time distribution.
 
@@ -538,11 +867,11 @@ def distribution_solartime_figure( year, month, day, epsfile ):
 
     for rec in maprecs:
         color = colormap[rec['mission']]
-        ax.scatter( rec['solartimes'], rec['latitudes'], color=color, s=0.25 )
+        ax.scatter( rec['solartimes'], rec['latitudes'], color=color, s=0.25, rasterized=True )
 
     #  Done with figure.
 
     print( f"Writing to {epsfile}." )
-    fig.savefig( epsfile, format='eps' )
+    fig.savefig( epsfile, format='eps', dpi=300 )
 
     return